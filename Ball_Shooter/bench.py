@@ -0,0 +1,237 @@
+import argparse
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import count, product
+from config import *
+from game.entities import Bullet
+from game.simulation import Simulation
+from network.protocol import encode_snapshot
+from network.snapshots import SnapshotHistory, build_state, view_state
+
+PLAYER_COUNTS = (10, 50, 200)
+BULLET_COUNTS = (100, 1000, 10000)
+
+# Area-of-interest views are encoded for this many players per broadcast and timed one by one
+VIEW_SAMPLE = 10
+# Timing changes smaller than this are noise on a busy machine, whatever the threshold says
+MIN_REGRESSION_US = 20.0
+
+class Scenario:
+    """A simulation held at a fixed number of players and live bullets, with every player
+    moving on random inputs and every bullet flying in a random direction"""
+
+    def __init__(self, players, bullets, seed=0):
+        self.player_count = players
+        self.bullet_count = bullets
+        self.rng = random.Random(seed)
+        self.simulation = Simulation(seed)
+        for i in range(players):
+            self.simulation.add_player(f"p{i}", PLAYER_COLORS[i % len(PLAYER_COLORS)], f"Player {i}")
+        self.player_ids = list(self.simulation.players)
+        self.bullet_numbers = count(1)
+        self.sequence = 0
+        self.history = SnapshotHistory()
+        self.acked = None
+        self.refill()
+
+    def refill(self):
+        """Replace the bullets that hit someone or left the map"""
+        bullets = self.simulation.bullets
+        rng = self.rng
+        for _ in range(self.bullet_count - len(bullets)):
+            angle = rng.uniform(0, 2 * math.pi)
+            owner = rng.choice(self.player_ids)
+            bullets.add(f"b{next(self.bullet_numbers)}", rng.uniform(0, MAP_WIDTH), rng.uniform(0, MAP_HEIGHT),
+                        math.cos(angle) * BULLET_SPEED, math.sin(angle) * BULLET_SPEED, owner,
+                        self.simulation.players[owner]["color"], self.simulation.tick)
+
+    def commands(self):
+        """One input command per player, and a respawn request for each dead one"""
+        self.sequence += 1
+        rng = self.rng
+        commands = []
+        for pid in self.player_ids:
+            commands.append({"player_id": pid, "inputs": [(self.sequence, rng.randrange(16), rng.uniform(0, 360), 0)]})
+            if not self.simulation.players[pid]["alive"]:
+                commands.append({"respawn_request": pid})
+        return commands
+
+    def tick(self, phase, sizes):
+        """Run one server tick, timing each phase; broadcast ticks also encode the snapshot
+        and a sample of the per-player views GameServer would send"""
+        simulation = self.simulation
+        commands = self.commands()
+        with phase("apply"):
+            for msg in commands:
+                simulation.apply(msg)
+        simulation.phase = phase
+        simulation.step()
+
+        if simulation.tick % max(1, SIM_RATE // BROADCAST_RATE):
+            return
+        bullets = simulation.bullets
+        with phase("snapshot"):
+            state = build_state(simulation.tick, simulation.players, bullets, simulation.used_colors)
+            self.history.record(state)
+        with phase("encode"):
+            message = self.history.encode_for(state, self.acked, {})
+        views = []
+        for pid in self.player_ids[:VIEW_SAMPLE]:
+            pdata = simulation.players[pid]
+            with phase("encode_view"):
+                views.append(encode_snapshot(view_state(state, bullets, (pdata["x"], pdata["y"]), AOI_RADIUS)))
+        with phase("bullet_dicts"):
+            for bdata in bullets.to_dict().values():
+                Bullet.from_dict(bdata).to_dict()
+
+        if sizes is not None:
+            sizes["keyframe"].append(len(encode_snapshot(state)))
+            sizes["delta"].append(len(message))
+            sizes["view"].append(sum(map(len, views)) / len(views))
+        # Clients ack every snapshot they get
+        self.acked = state["tick"]
+        self.refill()
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_us": statistics.fmean(samples),
+        "median_us": statistics.median(samples),
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "max_us": samples[-1]
+    }
+
+def run_scenario(players, bullets, ticks, warmup, seed):
+    """Time a scenario, then rerun it under tracemalloc for its allocations per tick"""
+    scenario = Scenario(players, bullets, seed)
+    timings = defaultdict(list)
+
+    @contextmanager
+    def timed(name):
+        start = time.perf_counter()
+        yield
+        timings[name].append((time.perf_counter() - start) * 1e6)
+
+    @contextmanager
+    def untimed(name):
+        yield
+
+    for _ in range(warmup):
+        scenario.tick(untimed, None)
+    sizes = defaultdict(list)
+    for _ in range(ticks):
+        scenario.tick(timed, sizes)
+    # Ticks the simulation alone could run per second, without snapshots or harness work
+    simulated = sum(sum(timings[name]) for name in ("apply", "update", "collision")) / 1e6
+
+    # The tracer slows everything down, so it gets its own, shorter run
+    peaks = []
+    tracemalloc.start()
+    for _ in range(max(1, ticks // 10)):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        scenario.tick(untimed, None)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return {
+        "players": players,
+        "bullets": bullets,
+        "ticks": ticks,
+        "sim_ticks_per_s": ticks / simulated,
+        "phases": {name: _summary(samples) for name, samples in timings.items()},
+        "bytes": {kind: statistics.fmean(values) for kind, values in sizes.items()},
+        "peak_alloc_bytes_per_tick": statistics.fmean(peaks)
+    }
+
+def compare(results, baseline, threshold):
+    """Metrics that got worse than the baseline by more than threshold, as readable lines"""
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+
+        metrics = [(f"{phase} median_us", stats["median_us"], base["phases"].get(phase, {}).get("median_us"),
+                    MIN_REGRESSION_US) for phase, stats in result["phases"].items()]
+        metrics += [(f"{kind} bytes", size, base["bytes"].get(kind), 0) for kind, size in result["bytes"].items()]
+        metrics.append(("peak alloc bytes", result["peak_alloc_bytes_per_tick"],
+                        base.get("peak_alloc_bytes_per_tick"), 0))
+
+        for metric, value, old, floor in metrics:
+            if old and value > old * (1 + threshold) and value - old > floor:
+                regressions.append(f"{name} {metric}: {old:.1f} -> {value:.1f} (+{100 * (value / old - 1):.0f}%)")
+    return regressions
+
+def format_result(name, result):
+    phases = "  ".join(f"{phase} {stats['median_us']:.0f}" for phase, stats in result["phases"].items())
+    return (f"{name:>12}  {result['sim_ticks_per_s']:7.0f} ticks/s  median us: {phases}  "
+            f"delta {result['bytes']['delta']:.0f} B  view {result['bytes']['view']:.0f} B  "
+            f"alloc {result['peak_alloc_bytes_per_tick'] / 1024:.0f} KiB")
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    """Run every scenario; returns the process exit status"""
+    results = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "scenarios": {}
+    }
+    for players, bullets in product(args.players, args.bullets):
+        result = run_scenario(players, bullets, args.ticks, args.warmup, args.seed)
+        name = f"p{players}_b{bullets}"
+        results["scenarios"][name] = result
+        print(format_result(name, result), flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {100 * args.threshold:.0f}% against {args.baseline}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Ball Shooter server hot paths")
+    parser.add_argument("--players", type=int, nargs="+", default=PLAYER_COUNTS)
+    parser.add_argument("--bullets", type=int, nargs="+", default=BULLET_COUNTS)
+    parser.add_argument("--ticks", type=int, default=300,
+                        help="timed ticks per scenario; at least one broadcast interval")
+    parser.add_argument("--warmup", type=int, default=30, help="untimed ticks before each scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fail when a metric is this much worse than the baseline")
+    args = parser.parse_args()
+    # Snapshot sizes are only measured on broadcast ticks
+    broadcast_interval = max(1, SIM_RATE // BROADCAST_RATE)
+    if args.ticks < broadcast_interval:
+        parser.error(f"--ticks must be at least {broadcast_interval} so a broadcast falls in the timed run")
+    sys.exit(run(args))
+
+if __name__ == "__main__":
+    main()
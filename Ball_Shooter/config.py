@@ -1,4 +1,48 @@
 PORT = 7777
+# "threaded" runs a thread per client; "selectors" serves everything from one event loop;
+# "lobby" admits clients on PORT and runs each match as a room in a pool of worker processes;
+# "split" runs the simulation in one process and client I/O in SPLIT_IO_PROCESSES others
+SERVER_MODE = "threaded"
+# Worker processes for lobby rooms, None for one per CPU core, and players per room
+ROOM_WORKERS = None
+ROOM_CAPACITY = 16
+# Seconds between room metric reports, and how long a room stays open with nobody in it
+ROOM_REPORT_INTERVAL = 1.0
+ROOM_IDLE_TIMEOUT = 30.0
+# Split mode shares snapshots through a ring of fixed-size slots in shared memory; players
+# and bullets beyond a slot's capacity are left out of snapshots
+SPLIT_IO_PROCESSES = 2
+SHM_SNAPSHOT_SLOTS = 4
+SHM_MAX_PLAYERS = 256
+SHM_MAX_BULLETS = 8192
+# Bytes of client messages each I/O process can queue for the simulation
+SHM_QUEUE_SIZE = 1 << 20
+# How often I/O processes look for a new snapshot
+SHM_POLL_INTERVAL = 0.001
+# Snapshots waiting for a slow client beyond this many replace the oldest one, and a client
+# whose queue has not moved for SLOW_CLIENT_TIMEOUT seconds is disconnected
+MAX_QUEUED_SNAPSHOTS = 4
+SLOW_CLIENT_TIMEOUT = 5.0
+MAX_FRAME_SIZE = 1 << 22
+# Local HTTP endpoint serving server stats as JSON; None disables it
+STATS_PORT = None
+STATS_HOST = "127.0.0.1"
+# Record each hosted match to this file (time.strftime fields allowed, e.g.
+# "match-%Y%m%d-%H%M%S.bsr"); None disables recording
+RECORD_PATH = None
+# Ticks between replay keyframes; seeking decodes from the keyframe at or before a tick
+RECORD_KEYFRAME_INTERVAL = 300
+# Records waiting for the writer thread; past this the tick drops them rather than wait on the disk
+RECORD_QUEUE_SIZE = 4096
+# "tcp" streams everything over one connection; "udp" sends snapshots and player updates as
+# datagrams (newest wins) and joins, respawns, bullets and disconnects on a reliable channel
+TRANSPORT = "tcp"
+# Larger snapshots are dropped rather than sent, and a client whose keyframe is larger is
+# disconnected; keep AOI_RADIUS on so keyframes stay small
+UDP_MAX_DATAGRAM = 60000
+UDP_RESEND_INTERVAL = 0.1
+UDP_MAX_RESENDS = 30
+UDP_TIMEOUT = 5.0
 
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 800
@@ -11,11 +55,48 @@ BULLET_SPEED = 10
 BULLET_RADIUS = 6
 BULLET_DAMAGE = 20
 SHOOT_COOLDOWN = 0.3
+# "state": clients send their own position and bullets; "input": clients send key, aim and
+# fire commands that the server simulates, and predict locally until the server acks them
+CONTROL_MODE = "state"
+# Most player updates a client sends per second; unchanged state is only resent as a
+# keepalive every UPLINK_KEEPALIVE seconds
+UPLINK_RATE = 30
+UPLINK_KEEPALIVE = 1.0
+# Unacknowledged inputs repeated in every input message so a lost packet loses nothing
+INPUT_REDUNDANCY = 4
+# The server applies one input per player per tick, and at most this many at once after a
+# pause; later inputs wait for the client to resend them
+MAX_INPUT_BURST = 8
+
+# Simulation ticks per second and snapshots per second sent to clients
+SIM_RATE = 60
+BROADCAST_RATE = 20
+# Clients draw remote players and bullets this many seconds behind the newest snapshot,
+# which should span at least two snapshot intervals, and extrapolate at most
+# MAX_EXTRAPOLATION seconds past it when snapshots are late
+INTERPOLATION_DELAY = 0.1
+MAX_EXTRAPOLATION = 0.1
+# When the server falls behind: "catchup" runs up to MAX_CATCHUP_TICKS ticks at once, "skip" runs one
+OVERRUN_POLICY = "catchup"
+MAX_CATCHUP_TICKS = 5
+
+SNAPSHOT_HISTORY = 64
+# Clients get full detail for entities within this distance of their player and only
+# coarse player positions beyond it; set to 0 to send everything to everyone
+AOI_RADIUS = 900
+AOI_COARSE_GRID = 25
 
 MINIMAP_SIZE = 150
 LEADERBOARD_WIDTH = 250
 FONT_SIZE = 28
 LARGE_FONT_SIZE = 48
+# Rendered text surfaces kept for reuse
+TEXT_CACHE_SIZE = 256
+# Pre-rendered barrel rotations; 72 gives 5 degree steps
+BARREL_ANGLES = 72
+# Redraw and present only the regions that changed while the camera holds still (e.g. at a
+# map edge); any camera movement falls back to a full redraw
+DIRTY_RECTS = False
 
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
@@ -0,0 +1,170 @@
+import math
+import numpy as np
+from config import *
+
+class BulletStore:
+    """Structure-of-arrays table of live bullets for the server simulation"""
+
+    def __init__(self, capacity=256):
+        self.count = 0
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.owner = np.zeros(capacity, dtype=np.int32)
+        self.color = np.zeros(capacity, dtype=np.int32)
+        self.seq = np.zeros(capacity, dtype=np.int64)
+        self.ids = np.empty(capacity, dtype=object)
+        self.spawns = np.empty(capacity, dtype=object)
+
+        self.owner_ids = []
+        self.colors = []
+        self._owner_index = {}
+        self._color_index = {}
+        self._rows = {}
+        self._next_seq = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, bullet_id):
+        return bullet_id in self._rows
+
+    def _columns(self):
+        return ("x", "y", "vx", "vy", "owner", "color", "seq", "ids", "spawns")
+
+    def _grow(self):
+        """Double the capacity of every column"""
+        capacity = max(1, len(self.x) * 2)
+        for name in self._columns():
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def _intern_owner(self, owner_id):
+        index = self._owner_index.get(owner_id)
+        if index is None:
+            index = self._owner_index[owner_id] = len(self.owner_ids)
+            self.owner_ids.append(owner_id)
+        return index
+
+    def _intern_color(self, color):
+        color = tuple(color)
+        index = self._color_index.get(color)
+        if index is None:
+            index = self._color_index[color] = len(self.colors)
+            self.colors.append(color)
+        return index
+
+    def add(self, bullet_id, x, y, vx, vy, owner_id, color, tick=0):
+        """Insert a bullet, replacing any existing bullet with the same id;
+        tick is the simulation tick at which (x, y) was its position"""
+        row = self._rows.get(bullet_id)
+        if row is None:
+            if self.count == len(self.x):
+                self._grow()
+            row = self.count
+            self.count += 1
+            self._rows[bullet_id] = row
+            self.ids[row] = bullet_id
+            self.seq[row] = self._next_seq
+            self._next_seq += 1
+
+        self.x[row] = x
+        self.y[row] = y
+        self.vx[row] = vx
+        self.vy[row] = vy
+        self.owner[row] = self._intern_owner(owner_id)
+        self.color[row] = self._intern_color(color)
+        self.spawns[row] = (x, y, vx, vy, owner_id, self.colors[self.color[row]], tick)
+
+    def add_dict(self, data, tick=0):
+        """Insert a bullet from its network dictionary; non-finite motion is rejected"""
+        if not all(math.isfinite(data[key]) for key in ("x", "y", "vx", "vy")):
+            raise ValueError(f"Bullet {data['id']} has a non-finite position or velocity")
+        self.add(data["id"], data["x"], data["y"], data["vx"], data["vy"],
+                 data["owner_id"], data["color"], tick)
+
+    def remove(self, bullet_id):
+        """Remove a bullet by id if present"""
+        row = self._rows.get(bullet_id)
+        if row is not None:
+            self.remove_rows(np.array([row]))
+
+    def remove_rows(self, rows):
+        """Swap-remove the given rows, filling holes from the tail of the table"""
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if not len(rows):
+            return
+
+        n = self.count
+        new_count = n - len(rows)
+        for bullet_id in self.ids[rows].tolist():
+            del self._rows[bullet_id]
+
+        holes = rows[rows < new_count]
+        tail = np.ones(n - new_count, dtype=bool)
+        tail[rows[rows >= new_count] - new_count] = False
+        sources = np.nonzero(tail)[0] + new_count
+
+        if len(holes):
+            for name in self._columns():
+                column = getattr(self, name)
+                column[holes] = column[sources]
+            for bullet_id, row in zip(self.ids[holes].tolist(), holes.tolist()):
+                self._rows[bullet_id] = row
+
+        self.ids[new_count:n] = None
+        self.spawns[new_count:n] = None
+        self.count = new_count
+
+    def update(self):
+        """Advance every bullet one tick and drop those that left the map"""
+        n = self.count
+        if not n:
+            return
+
+        x, y = self.x[:n], self.y[:n]
+        x += self.vx[:n]
+        y += self.vy[:n]
+
+        # Written as the inverse of the in-bounds test so NaN positions are dropped too
+        out = ~((x >= 0) & (x <= MAP_WIDTH) & (y >= 0) & (y <= MAP_HEIGHT))
+        if out.any():
+            self.remove_rows(np.nonzero(out)[0])
+
+    def order(self, rows=None):
+        """Sort row indices (all live rows by default) into the order they were fired"""
+        if rows is None:
+            rows = np.arange(self.count)
+        return rows[np.argsort(self.seq[rows], kind="stable")]
+
+    def rows(self):
+        """Yield (id, x, y, vx, vy, owner_id, color) for live bullets, oldest first"""
+        rows = self.order()
+        owner_ids, colors = self.owner_ids, self.colors
+        for bullet_id, x, y, vx, vy, owner, color in zip(
+                self.ids[rows].tolist(), self.x[rows].tolist(), self.y[rows].tolist(),
+                self.vx[rows].tolist(), self.vy[rows].tolist(),
+                self.owner[rows].tolist(), self.color[rows].tolist()):
+            yield bullet_id, x, y, vx, vy, owner_ids[owner], colors[color]
+
+    def spawn_records(self):
+        """Map bullet ids to the (x, y, vx, vy, owner_id, color, tick) they were fired with;
+        current positions follow from the tick difference"""
+        n = self.count
+        return dict(zip(self.ids[:n].tolist(), self.spawns[:n].tolist()))
+
+    def records(self, mask):
+        """spawn_records for the live bullets selected by a boolean mask"""
+        n = self.count
+        return dict(zip(self.ids[:n][mask].tolist(), self.spawns[:n][mask].tolist()))
+
+    def to_dict(self):
+        """Serialize live bullets as {id: bullet dict}, oldest first"""
+        return {
+            bullet_id: {"x": x, "y": y, "vx": vx, "vy": vy,
+                        "owner_id": owner_id, "id": bullet_id, "color": color}
+            for bullet_id, x, y, vx, vy, owner_id, color in self.rows()
+        }
@@ -2,8 +2,27 @@ import pygame
 import math
 import random
 import time
+from itertools import count
 from config import *
 
+# Movement keys in the bit order used by input commands
+MOVE_KEYS = (pygame.K_w, pygame.K_a, pygame.K_s, pygame.K_d)
+
+def keys_to_mask(keys):
+    """Pack the pressed movement keys into a bitmask"""
+    mask = 0
+    for i, key in enumerate(MOVE_KEYS):
+        if keys[key]:
+            mask |= 1 << i
+    return mask
+
+def mask_to_keys(mask):
+    """Unpack a movement bitmask into something Player.move can read"""
+    return {key: bool(mask & (1 << i)) for i, key in enumerate(MOVE_KEYS)}
+
+# Bullet ids only need to be unique per owner
+_bullet_numbers = count(1)
+
 class Camera:
     def __init__(self):
         self.x = 0
@@ -22,24 +41,39 @@ class Camera:
         return x - self.x, y - self.y
 
 class GameObject:
+    __slots__ = ("x", "y")
+    
     def __init__(self, x, y):
         self.x = x
         self.y = y
 
 class Bullet(GameObject):
-    def __init__(self, x, y, vx, vy, owner_id, color):
+    __slots__ = ("vx", "vy", "owner_id", "color", "id")
+    
+    def __init__(self, x, y, vx, vy, owner_id, color, bullet_id=None):
         super().__init__(x, y)
+        self.reset(x, y, vx, vy, owner_id, color, bullet_id)
+    
+    def reset(self, x, y, vx, vy, owner_id, color, bullet_id=None):
+        """Reinitialize in place so pooled bullets can be reused"""
+        self.x = x
+        self.y = y
         self.vx = vx
         self.vy = vy
         self.owner_id = owner_id
         self.color = color
-        self.id = f"{owner_id}_{random.randint(10000, 99999)}"
+        self.id = bullet_id if bullet_id is not None else f"{owner_id}_{next(_bullet_numbers)}"
     
     def update(self):
         """Update bullet position"""
         self.x += self.vx
         self.y += self.vy
     
+    def advance(self, ticks):
+        """Move the bullet forward by a number of simulation ticks"""
+        self.x += self.vx * ticks
+        self.y += self.vy * ticks
+    
     def out_of_bounds(self):
         """Check if bullet is out of map bounds"""
         return not (0 <= self.x <= MAP_WIDTH and 0 <= self.y <= MAP_HEIGHT)
@@ -58,12 +92,30 @@ class Bullet(GameObject):
     @classmethod
     def from_dict(cls, data):
         """Create bullet from dictionary"""
-        bullet = cls(data["x"], data["y"], data["vx"], data["vy"], 
-                    data["owner_id"], data["color"])
-        bullet.id = data["id"]
+        return cls(data["x"], data["y"], data["vx"], data["vy"],
+                   data["owner_id"], data["color"], data["id"])
+
+class BulletPool:
+    """Recycles Bullet objects for the client's mirror of the server's bullets"""
+    
+    def __init__(self):
+        self.free = []
+    
+    def acquire(self, data):
+        """A bullet initialized from a dictionary, reusing a released one if possible"""
+        if not self.free:
+            return Bullet.from_dict(data)
+        bullet = self.free.pop()
+        bullet.reset(data["x"], data["y"], data["vx"], data["vy"],
+                     data["owner_id"], data["color"], data["id"])
         return bullet
+    
+    def release(self, bullet):
+        self.free.append(bullet)
 
 class Player(GameObject):
+    __slots__ = ("id", "angle", "hp", "color", "name", "last_shot", "alive", "kills", "connected")
+    
     def __init__(self, pid, x, y, color, name="Player"):
         super().__init__(x, y)
         self.id = pid
@@ -105,12 +157,14 @@ class Player(GameObject):
         world_my = my + camera.y
         self.angle = math.degrees(math.atan2(-(world_my - self.y), world_mx - self.x))
     
-    def shoot(self):
-        """Create a bullet if cooldown allows"""
-        if not self.alive or time.time() - self.last_shot < SHOOT_COOLDOWN:
+    def shoot(self, now=None):
+        """Create a bullet if cooldown allows; now is the time in seconds, wall clock by default"""
+        if now is None:
+            now = time.time()
+        if not self.alive or now - self.last_shot < SHOOT_COOLDOWN:
             return None
         
-        self.last_shot = time.time()
+        self.last_shot = now
         rad = math.radians(-self.angle)
         
         spawn_distance = 40
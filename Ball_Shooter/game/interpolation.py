@@ -0,0 +1,93 @@
+import bisect
+import time
+from collections import deque
+from config import SIM_RATE, INTERPOLATION_DELAY, MAX_EXTRAPOLATION
+
+# A jump this large between snapshots is a respawn or teleport and is not smoothed
+SNAP_DISTANCE = 100
+
+class ServerClock:
+    """Estimates the server's current tick from snapshot arrival times"""
+
+    def __init__(self, sim_rate=SIM_RATE, clock=time.monotonic):
+        self.sim_rate = sim_rate
+        self.clock = clock
+        self.offset = None
+        self.latest_tick = None
+
+    def observe(self, tick):
+        """Record that the snapshot for tick has just arrived"""
+        sample = tick / self.sim_rate - self.clock()
+        # The fastest arrival is the best estimate; slower ones only pull it back gradually
+        if self.offset is None or sample > self.offset:
+            self.offset = sample
+        else:
+            self.offset += (sample - self.offset) * 0.05
+        self.latest_tick = tick if self.latest_tick is None else max(self.latest_tick, tick)
+
+    def render_tick(self, delay=INTERPOLATION_DELAY, max_extrapolation=MAX_EXTRAPOLATION):
+        """The (fractional) tick to draw remote entities at, or None before any snapshot"""
+        if self.offset is None:
+            return None
+        tick = (self.clock() + self.offset - delay) * self.sim_rate
+        return min(tick, self.latest_tick + max_extrapolation * self.sim_rate)
+
+def _lerp_angle(a, b, t):
+    """Interpolate between angles in degrees along the shorter way round"""
+    diff = (b - a + 180) % 360 - 180
+    return a + diff * t
+
+class InterpolationBuffer:
+    """Recent (tick, x, y, angle) samples per remote entity, sampled at a delayed tick"""
+
+    def __init__(self, size=32, max_extrapolation=MAX_EXTRAPOLATION * SIM_RATE):
+        self.size = size
+        self.max_extrapolation = max_extrapolation
+        self.samples = {}
+
+    def record(self, tick, updates):
+        """Add a snapshot; entities missing from updates are held at their last position"""
+        for key, history in self.samples.items():
+            if key not in updates and history[-1][0] < tick:
+                history.append((tick,) + history[-1][1:])
+
+        for key, (x, y, angle) in updates.items():
+            history = self.samples.get(key)
+            if history is None:
+                self.samples[key] = deque([(tick, x, y, angle)], maxlen=self.size)
+                continue
+            last_tick, last_x, last_y, _ = history[-1]
+            if abs(x - last_x) > SNAP_DISTANCE or abs(y - last_y) > SNAP_DISTANCE:
+                history.clear()
+            elif last_tick >= tick:
+                continue
+            history.append((tick, x, y, angle))
+
+    def remove(self, key):
+        self.samples.pop(key, None)
+
+    def sample(self, key, tick):
+        """Position and angle of an entity at tick, or None if it is not tracked"""
+        history = self.samples.get(key)
+        if not history:
+            return None
+
+        first = history[0]
+        if tick <= first[0]:
+            return first[1:]
+
+        last = history[-1]
+        if tick >= last[0]:
+            if len(history) < 2:
+                return last[1:]
+            prev = history[-2]
+            span = last[0] - prev[0]
+            ahead = min(tick - last[0], self.max_extrapolation)
+            t = ahead / span
+            return (last[1] + (last[1] - prev[1]) * t, last[2] + (last[2] - prev[2]) * t,
+                    _lerp_angle(prev[3], last[3], 1 + t))
+
+        i = bisect.bisect_right([entry[0] for entry in history], tick)
+        a, b = history[i - 1], history[i]
+        t = (tick - a[0]) / (b[0] - a[0])
+        return a[1] + (b[1] - a[1]) * t, a[2] + (b[2] - a[2]) * t, _lerp_angle(a[3], b[3], t)
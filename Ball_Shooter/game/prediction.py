@@ -0,0 +1,52 @@
+from config import SIM_RATE, INPUT_REDUNDANCY
+from game.entities import keys_to_mask, mask_to_keys
+from network.protocol import BUTTON_FIRE
+
+class InputPredictor:
+    """Input commands the server has not acknowledged yet, for predicting and replaying
+    the local player's movement"""
+
+    def __init__(self, player, limit=SIM_RATE * 2):
+        self.player = player
+        self.limit = limit
+        self.sequence = 0
+        self.sent = 0
+        self.last_angle = None
+        self.pending = []
+        self.latest_ack = None
+        self.acked = False
+
+    def record(self, keys, fire=False):
+        """Remember the input for the frame just predicted; idle frames are not recorded"""
+        mask = keys_to_mask(keys)
+        if not mask and not fire and self.player.angle == self.last_angle:
+            return
+        self.last_angle = self.player.angle
+        self.sequence += 1
+        self.pending.append((self.sequence, mask, self.player.angle, BUTTON_FIRE if fire else 0))
+        if len(self.pending) > self.limit:
+            del self.pending[0]
+
+    def outgoing(self, redundancy=INPUT_REDUNDANCY):
+        """Inputs not sent yet, preceded by up to redundancy unacknowledged ones that were"""
+        fresh = 0
+        while fresh < len(self.pending) and self.pending[-fresh - 1][0] > self.sent:
+            fresh += 1
+        self.sent = self.sequence
+        return self.pending[-(fresh + redundancy):] if fresh else []
+
+    def acknowledge(self, sequence, x, y):
+        """Store a server ack; applied by the next reconcile() on the game thread"""
+        self.latest_ack = (sequence, x, y)
+        self.acked = True
+
+    def reconcile(self):
+        """Move to the server's position for the last acked input and replay the rest"""
+        ack, self.latest_ack = self.latest_ack, None
+        if ack is None:
+            return
+        sequence, x, y = ack
+        self.pending = [command for command in self.pending if command[0] > sequence]
+        self.player.x, self.player.y = x, y
+        for _, mask, _, _ in self.pending:
+            self.player.move(mask_to_keys(mask))
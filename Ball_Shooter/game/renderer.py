@@ -1,16 +1,76 @@
 import pygame
-import math
+from collections import OrderedDict
 from config import *
+from game.sprites import HEALTH_BAR_SIZE, SpriteAtlas
+
+class TextCache:
+    """Least-recently-used cache of rendered text surfaces"""
+    
+    def __init__(self, size=TEXT_CACHE_SIZE):
+        self.size = size
+        self.surfaces = OrderedDict()
+    
+    def render(self, font, text, color):
+        """Return the surface for text in color, rendering it only on a miss"""
+        key = (id(font), text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+        
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.size:
+            self.surfaces.popitem(last=False)
+        return surface
 
 class GameRenderer:
-    def __init__(self, screen, font, large_font):
+    def __init__(self, screen, font, large_font, dirty_rects=DIRTY_RECTS):
         self.screen = screen
         self.font = font
         self.large_font = large_font
+        self.text = TextCache()
+        self.sprites = SpriteAtlas()
+        self.minimap_background = self._build_minimap_background()
+        self.leaderboard = None
+        self.leaderboard_key = None
+        
+        # Dirty rectangle mode: the map as last painted, and the regions drawn over it
+        self.dirty_rects = dirty_rects
+        self.background = None
+        self.background_camera = None
+        self.full_redraw = True
+        self.changed = []
+        self.previous = []
+    
+    def _build_minimap_background(self):
+        """Pre-render the minimap frame, which never changes"""
+        surface = pygame.Surface((MINIMAP_SIZE, MINIMAP_SIZE))
+        surface.fill(DARK_GRAY)
+        pygame.draw.rect(surface, WHITE, (2, 2, MINIMAP_SIZE - 4, MINIMAP_SIZE - 4))
+        return surface
     
     def draw_map(self, camera):
         """Draw the game map with boundaries"""
-        self.screen.fill(BLACK)
+        if not self.dirty_rects:
+            self._paint_map(self.screen, camera)
+            return
+        
+        if (camera.x, camera.y) != self.background_camera:
+            # The view scrolled, so everything on screen is stale
+            if self.background is None:
+                self.background = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+            self._paint_map(self.background, camera)
+            self.background_camera = (camera.x, camera.y)
+            self.screen.blit(self.background, (0, 0))
+            self.full_redraw = True
+        else:
+            # Only erase what the last frame drew
+            for rect in self.previous:
+                self.screen.blit(self.background, rect, rect)
+    
+    def _paint_map(self, surface, camera):
+        surface.fill(BLACK)
         
         map_screen_x, map_screen_y = camera.apply(0, 0)
         map_rect = pygame.Rect(map_screen_x, map_screen_y, MAP_WIDTH, MAP_HEIGHT)
@@ -18,54 +78,89 @@ class GameRenderer:
         
         visible_rect = map_rect.clip(screen_rect)
         if visible_rect.width > 0 and visible_rect.height > 0:
-            pygame.draw.rect(self.screen, WHITE, visible_rect)
+            pygame.draw.rect(surface, WHITE, visible_rect)
+    
+    def _mark(self, rect):
+        """Note a region drawn this frame, for dirty rectangle updates"""
+        if self.dirty_rects:
+            self.changed.append(rect)
+    
+    def present(self):
+        """Show the frame, updating only changed regions when nothing forced a full redraw"""
+        if self.dirty_rects and not self.full_redraw:
+            # What the last frame drew has been erased, so it needs updating too
+            pygame.display.update(self.previous + self.changed)
+        else:
+            pygame.display.flip()
+        self.previous, self.changed = self.changed, []
+        self.full_redraw = False
     
     def draw_player(self, player, camera):
         """Draw a single player"""
-        screen_x, screen_y = camera.apply(player.x, player.y)
-        
-        if not (-PLAYER_RADIUS <= screen_x <= SCREEN_WIDTH + PLAYER_RADIUS and 
-                -PLAYER_RADIUS <= screen_y <= SCREEN_HEIGHT + PLAYER_RADIUS):
-            return
-        
-        color = GRAY if not player.alive else player.color
-        pygame.draw.circle(self.screen, color, (int(screen_x), int(screen_y)), PLAYER_RADIUS)
-        
-        if player.alive:
-            rad = math.radians(-player.angle)
-            bx = screen_x + math.cos(rad) * 40
-            by = screen_y + math.sin(rad) * 40
-            pygame.draw.line(self.screen, GRAY, (screen_x, screen_y), (bx, by), 6)
-            
-            self._draw_health_bar(screen_x, screen_y, player.hp)
+        self.draw_players([player], camera)
     
-    def _draw_health_bar(self, x, y, hp):
-        """Draw health bar above player"""
-        bar_w, bar_h = 50, 6
-        bar_x = x - bar_w // 2
-        bar_y = y - PLAYER_RADIUS - 15
-        
-        pygame.draw.rect(self.screen, RED, (bar_x, bar_y, bar_w, bar_h))
-        pygame.draw.rect(self.screen, GREEN, (bar_x, bar_y, bar_w * hp / 100, bar_h))
+    def draw_players(self, players, camera):
+        """Draw every visible player in one batched blit"""
+        bar_w, bar_h = HEALTH_BAR_SIZE
+        batch = []
+        
+        for player in players:
+            screen_x, screen_y = camera.apply(player.x, player.y)
+            if not (-PLAYER_RADIUS <= screen_x <= SCREEN_WIDTH + PLAYER_RADIUS and 
+                    -PLAYER_RADIUS <= screen_y <= SCREEN_HEIGHT + PLAYER_RADIUS):
+                continue
+            
+            x, y = int(screen_x), int(screen_y)
+            color = GRAY if not player.alive else player.color
+            batch.append((self.sprites.circle(color, PLAYER_RADIUS), (x - PLAYER_RADIUS, y - PLAYER_RADIUS)))
+            
+            if player.alive:
+                barrel = self.sprites.barrel(player.angle)
+                half = barrel.get_width() // 2
+                batch.append((barrel, (x - half, y - half)))
+                
+                # Health bar above the player
+                bar_x = x - bar_w // 2
+                bar_y = y - PLAYER_RADIUS - 15
+                batch.append((self.sprites.health_back, (bar_x, bar_y)))
+                batch.append((self.sprites.health_front, (bar_x, bar_y),
+                              (0, 0, int(bar_w * max(0, player.hp) / 100), bar_h)))
+        
+        rects = self.screen.blits(batch, doreturn=self.dirty_rects)
+        if rects:
+            self.changed.extend(rects)
     
     def draw_bullet(self, bullet, camera):
         """Draw a single bullet"""
-        screen_x, screen_y = camera.apply(bullet.x, bullet.y)
-        
-        if (-BULLET_RADIUS <= screen_x <= SCREEN_WIDTH + BULLET_RADIUS and 
-            -BULLET_RADIUS <= screen_y <= SCREEN_HEIGHT + BULLET_RADIUS):
-            pygame.draw.circle(self.screen, bullet.color, 
-                             (int(screen_x), int(screen_y)), BULLET_RADIUS)
+        self.draw_bullets([bullet], camera)
+    
+    def draw_bullets(self, bullets, camera):
+        """Draw every visible bullet in one batched blit"""
+        # Work in sprite top-left coordinates so each bullet costs two subtractions
+        left, top = camera.x + BULLET_RADIUS, camera.y + BULLET_RADIUS
+        low = -2 * BULLET_RADIUS
+        sprites = {}
+        batch = []
+        append = batch.append
+        
+        for bullet in bullets:
+            x, y = bullet.x - left, bullet.y - top
+            if low <= x <= SCREEN_WIDTH and low <= y <= SCREEN_HEIGHT:
+                sprite = sprites.get(bullet.color)
+                if sprite is None:
+                    sprite = sprites[bullet.color] = self.sprites.circle(bullet.color, BULLET_RADIUS)
+                append((sprite, (x, y)))
+        
+        rects = self.screen.blits(batch, doreturn=self.dirty_rects)
+        if rects:
+            self.changed.extend(rects)
     
     def draw_minimap(self, my_player, players):
         """Draw minimap in top-right corner"""
         minimap_x = SCREEN_WIDTH - MINIMAP_SIZE - 10
         minimap_y = 10
         
-        pygame.draw.rect(self.screen, DARK_GRAY, 
-                        (minimap_x, minimap_y, MINIMAP_SIZE, MINIMAP_SIZE))
-        pygame.draw.rect(self.screen, WHITE, 
-                        (minimap_x + 2, minimap_y + 2, MINIMAP_SIZE - 4, MINIMAP_SIZE - 4))
+        self._mark(self.screen.blit(self.minimap_background, (minimap_x, minimap_y)))
         
         scale_x = (MINIMAP_SIZE - 4) / MAP_WIDTH
         scale_y = (MINIMAP_SIZE - 4) / MAP_HEIGHT
@@ -88,33 +183,40 @@ class GameRenderer:
         if not sorted_players:
             return
         
-        board_height = min(len(sorted_players) * 25 + 30, 200)
-        pygame.draw.rect(self.screen, (*DARK_GRAY, 128), 
-                        (board_x, board_y, LEADERBOARD_WIDTH, board_height))
-        
-        title_text = self.font.render("Leaderboard", True, WHITE)
-        self.screen.blit(title_text, (board_x + 5, board_y + 5))
-        
-        for i, player in enumerate(sorted_players[:7]):
-            y_pos = board_y + 30 + i * 25
-            color = YELLOW if player.id == my_player.id else WHITE
-            text = self.font.render(f"{player.name}: {player.kills} kills", True, color)
-            self.screen.blit(text, (board_x + 5, y_pos))
+        # Only re-render the board when the rows it shows change
+        key = (len(sorted_players),
+               tuple((p.id == my_player.id, p.name, p.kills) for p in sorted_players[:7]))
+        if key != self.leaderboard_key:
+            self.leaderboard = self._render_leaderboard(key)
+            self.leaderboard_key = key
+        self._mark(self.screen.blit(self.leaderboard, (board_x, board_y)))
+    
+    def _render_leaderboard(self, key):
+        """Render the leaderboard box for a (player count, rows) key"""
+        count, rows = key
+        board_height = min(count * 25 + 30, 200)
+        surface = pygame.Surface((LEADERBOARD_WIDTH, board_height))
+        surface.fill(DARK_GRAY)
+        
+        surface.blit(self.text.render(self.font, "Leaderboard", WHITE), (5, 5))
+        for i, (is_me, name, kills) in enumerate(rows):
+            color = YELLOW if is_me else WHITE
+            surface.blit(self.text.render(self.font, f"{name}: {kills} kills", color), (5, 30 + i * 25))
+        return surface
     
     def draw_ui_info(self, my_player, player_count):
         """Draw game UI information"""
-        text = self.font.render(f"Players: {player_count}", True, BLACK)
-        self.screen.blit(text, (10, 10))
+        text = self.text.render(self.font, f"Players: {player_count}", BLACK)
+        self._mark(self.screen.blit(text, (10, 10)))
         
-        text = self.font.render(f"Position: ({int(my_player.x)}, {int(my_player.y)})", 
-                               True, BLACK)
-        self.screen.blit(text, (10, 40))
+        text = self.text.render(self.font, f"Position: ({int(my_player.x)}, {int(my_player.y)})", BLACK)
+        self._mark(self.screen.blit(text, (10, 40)))
         
-        text = self.font.render(f"Your Kills: {my_player.kills}", True, BLACK)
-        self.screen.blit(text, (10, 70))
+        text = self.text.render(self.font, f"Your Kills: {my_player.kills}", BLACK)
+        self._mark(self.screen.blit(text, (10, 70)))
     
     def draw_respawn_message(self):
         """Draw respawn message when player is dead"""
-        text = self.large_font.render("Press R to respawn", True, YELLOW)
+        text = self.text.render(self.large_font, "Press R to respawn", YELLOW)
         text_rect = text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 50))
-        self.screen.blit(text, text_rect)
\ No newline at end of file
+        self._mark(self.screen.blit(text, text_rect))
\ No newline at end of file
@@ -0,0 +1,220 @@
+import logging
+import math
+import random
+from contextlib import nullcontext
+from itertools import count
+import numpy as np
+from config import *
+from game.bullet_store import BulletStore
+from game.entities import Player, mask_to_keys
+from game.spatial import SpatialGrid
+from network.protocol import BUTTON_FIRE
+
+logger = logging.getLogger(__name__)
+
+def _untimed(name):
+    return nullcontext()
+
+class Simulation:
+    """The authoritative game rules, with no sockets, threads or wall clock
+
+    Client messages, in the dictionary shapes decode_message produces, are applied in
+    order with apply() or passed to step(), which then advances one tick and returns the
+    events it produced as (kind, player id, other player id or None) tuples: "join",
+    "leave", "respawn", "hit" and "kill" (the other id is the shooter). clock returns
+    seconds and defaults to simulation time, so ticks can run faster than real time;
+    respawn points come from a generator seeded with seed.
+    """
+
+    def __init__(self, seed=None, clock=None, sim_rate=SIM_RATE, phase=_untimed):
+        self.rng = random.Random(seed)
+        self.clock = clock or (lambda: self.tick / sim_rate)
+        # Context manager factory that times the "update" and "collision" phases
+        self.phase = phase
+        self.tick = 0
+        self.players = {}
+        self.bullets = BulletStore()
+        self.used_colors = set()
+        self.player_grid = SpatialGrid()
+        # Movers for input-driven players, the last input sequence applied to each and
+        # the (inputs allowed, tick) each was last credited at
+        self.input_players = {}
+        self.input_seqs = {}
+        self.input_credit = {}
+        self.bullet_numbers = count(1)
+        self.events = []
+
+    def add_player(self, pid, color, name="Player", x=None, y=None):
+        """Join a player at (x, y), or at a random spawn point"""
+        x = self._spawn_coordinate(MAP_WIDTH) if x is None else x
+        y = self._spawn_coordinate(MAP_HEIGHT) if y is None else y
+        self.apply({"players": {pid: Player(pid, x, y, color, name).to_dict()}})
+
+    def _spawn_coordinate(self, extent):
+        return self.rng.randint(PLAYER_RADIUS * 2, extent - PLAYER_RADIUS * 2)
+
+    def step(self, commands=()):
+        """Apply client messages, then advance the simulation one tick; returns the events
+        since the last step"""
+        for msg in commands:
+            self.apply(msg)
+        self.tick += 1
+        with self.phase("update"):
+            self.bullets.update()
+        with self.phase("collision"):
+            self._check_collisions()
+        events, self.events = self.events, []
+        return events
+
+    def apply(self, msg):
+        """Apply one client message before the next tick"""
+        if "leave" in msg:
+            self.remove_player(msg["leave"])
+            return
+
+        if "inputs" in msg:
+            self._apply_inputs(msg["player_id"], msg["inputs"])
+            return
+
+        # Handle respawn requests
+        if "respawn_request" in msg:
+            player_id = msg["respawn_request"]
+            if player_id in self.players:
+                player_data = self.players[player_id]
+                if not player_data.get("alive", True):
+                    # Server-side respawn
+                    player_data["hp"] = 100
+                    player_data["alive"] = True
+                    player_data["x"] = self._spawn_coordinate(MAP_WIDTH)
+                    player_data["y"] = self._spawn_coordinate(MAP_HEIGHT)
+                    self.events.append(("respawn", player_id, None))
+                    logger.debug("Player %s respawned at (%s, %s)", player_id, player_data["x"], player_data["y"])
+            return
+
+        if "players" in msg:
+            for pid, pdata in msg["players"].items():
+                # A NaN or infinite position has no grid cell
+                if not all(math.isfinite(pdata[key]) for key in ("x", "y", "angle")):
+                    raise ValueError(f"Non-finite position for player {pid}")
+                if pid in self.players:
+                    # Preserve server-authoritative values
+                    server_player = self.players[pid]
+
+                    # Only update position and angle if player is alive and not input-driven
+                    if server_player.get("alive", True) and pid not in self.input_players:
+                        server_player["x"] = pdata["x"]
+                        server_player["y"] = pdata["y"]
+                        server_player["angle"] = pdata["angle"]
+
+                    # Always preserve server's HP and alive status
+                    # Only update other non-critical fields
+                    server_player["connected"] = pdata.get("connected", True)
+                    server_player["name"] = pdata.get("name", "Player")
+                else:
+                    # New player joining, in one of the colors clients can pick from
+                    color = tuple(pdata["color"])
+                    if color not in PLAYER_COLORS:
+                        raise ValueError(f"Player {pid} joined with unknown color {color}")
+                    self.players[pid] = pdata
+                    self.used_colors.add(color)
+                    self.events.append(("join", pid, None))
+
+        if "new_bullets" in msg:
+            for bullet_data in msg["new_bullets"]:
+                self.bullets.add_dict(bullet_data, self.tick)
+
+    def remove_player(self, pid):
+        """Forget a player, its input state and its color unless another player shares it"""
+        pdata = self.players.pop(pid, None) if pid else None
+        if pdata is not None:
+            color = tuple(pdata["color"])
+            if all(tuple(other["color"]) != color for other in self.players.values()):
+                self.used_colors.discard(color)
+            self.events.append(("leave", pid, None))
+        self.input_players.pop(pid, None)
+        self.input_seqs.pop(pid, None)
+        self.input_credit.pop(pid, None)
+
+    def _apply_inputs(self, player_id, inputs):
+        """Simulate the input commands of a player that have not been applied yet, as many
+        as the player has been credited for; the rest are left for a later resend"""
+        pdata = self.players.get(player_id)
+        if pdata is None:
+            return
+
+        last = self.input_seqs.get(player_id, 0)
+        credit, credited = self.input_credit.get(player_id, (MAX_INPUT_BURST, self.tick))
+        credit = min(MAX_INPUT_BURST, credit + self.tick - credited)
+        mover = self.input_players.get(player_id)
+        if mover is None:
+            mover = self.input_players[player_id] = Player(player_id, pdata["x"], pdata["y"], pdata["color"])
+            mover.last_shot = -SHOOT_COOLDOWN
+
+        for sequence, mask, angle, buttons in inputs:
+            if sequence <= last:
+                continue
+            if credit <= 0:
+                break
+            credit -= 1
+            last = sequence
+            mover.x, mover.y, mover.angle = pdata["x"], pdata["y"], angle
+            mover.alive = pdata.get("alive", True)
+
+            # The client fires before it moves within a frame
+            if buttons & BUTTON_FIRE:
+                bullet = mover.shoot(self.clock())
+                if bullet:
+                    self.bullets.add(f"{player_id}_{next(self.bullet_numbers)}", bullet.x, bullet.y,
+                                     bullet.vx, bullet.vy, player_id, bullet.color, self.tick)
+
+            if mover.alive:
+                mover.move(mask_to_keys(mask))
+                pdata["x"], pdata["y"], pdata["angle"] = mover.x, mover.y, angle
+
+        self.input_seqs[player_id] = last
+        self.input_credit[player_id] = (credit, self.tick)
+
+    def _check_collisions(self):
+        """Check bullet-player collisions"""
+        bullets = self.bullets
+        players = self.players
+        hit_distance = PLAYER_RADIUS + BULLET_RADIUS
+
+        if not bullets or not players:
+            return
+
+        self.player_grid.rebuild((pid, pdata["x"], pdata["y"]) for pid, pdata in players.items())
+
+        n = len(bullets)
+        rows = np.nonzero(self.player_grid.near(bullets.x[:n], bullets.y[:n]))[0]
+        rows = bullets.order(rows)
+        rows_to_remove = []
+
+        for row, bx, by, owner in zip(rows.tolist(), bullets.x[rows].tolist(),
+                                      bullets.y[rows].tolist(), bullets.owner[rows].tolist()):
+            owner_id = bullets.owner_ids[owner]
+
+            for _, player_id, px, py in self.player_grid.query(bx, by):
+                player_data = players.get(player_id)
+                if player_data is None or owner_id == player_id or not player_data.get("alive", True):
+                    continue
+
+                if math.sqrt((bx - px)**2 + (by - py)**2) <= hit_distance:
+                    player_data["hp"] -= BULLET_DAMAGE
+                    self.events.append(("hit", player_id, owner_id))
+                    logger.debug("Player %s hit! HP: %s", player_id, player_data["hp"])
+
+                    if player_data["hp"] <= 0:
+                        player_data["hp"] = 0
+                        player_data["alive"] = False
+                        self.events.append(("kill", player_id, owner_id))
+                        logger.debug("Player %s died!", player_id)
+
+                        if owner_id in players:
+                            players[owner_id]["kills"] += 1
+                            logger.debug("Player %s got a kill!", owner_id)
+
+                    rows_to_remove.append(row)
+                    break
+
+        bullets.remove_rows(rows_to_remove)
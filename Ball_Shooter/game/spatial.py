@@ -0,0 +1,68 @@
+import math
+import numpy as np
+from config import *
+
+class SpatialGrid:
+    """Uniform grid over the map used as a collision broad-phase"""
+
+    def __init__(self, cell_size=PLAYER_RADIUS + BULLET_RADIUS,
+                 width=MAP_WIDTH, height=MAP_HEIGHT):
+        self.cell_size = cell_size
+        self.cols = max(1, math.ceil(width / cell_size))
+        self.rows = max(1, math.ceil(height / cell_size))
+        self.cells = [[] for _ in range(self.cols * self.rows)]
+        self._occupied = []
+
+    def _cell_coords(self, x, y):
+        """Return the (clamped) cell column and row containing a point"""
+        cx = int(x // self.cell_size)
+        cy = int(y // self.cell_size)
+        cx = max(0, min(self.cols - 1, cx))
+        cy = max(0, min(self.rows - 1, cy))
+        return cx, cy
+
+    def clear(self):
+        """Empty every cell touched since the last clear"""
+        for index in self._occupied:
+            self.cells[index].clear()
+        self._occupied.clear()
+
+    def insert(self, order, key, x, y):
+        """Add an entry; order is used to keep query results deterministic"""
+        cx, cy = self._cell_coords(x, y)
+        index = cy * self.cols + cx
+        cell = self.cells[index]
+        if not cell:
+            self._occupied.append(index)
+        cell.append((order, key, x, y))
+
+    def rebuild(self, entries):
+        """Clear the grid and insert (key, x, y) entries in iteration order"""
+        self.clear()
+        for order, (key, x, y) in enumerate(entries):
+            self.insert(order, key, x, y)
+
+    def query(self, x, y):
+        """Return entries in the 3x3 block of cells around a point, in insertion order"""
+        cx, cy = self._cell_coords(x, y)
+        found = []
+        for row in range(max(0, cy - 1), min(self.rows, cy + 2)):
+            base = row * self.cols
+            for col in range(max(0, cx - 1), min(self.cols, cx + 2)):
+                cell = self.cells[base + col]
+                if cell:
+                    found.extend(cell)
+        if len(found) > 1:
+            found.sort()
+        return found
+
+    def near(self, xs, ys):
+        """Vectorized test of which points have an entry in their 3x3 block of cells"""
+        occupied = np.zeros((self.rows, self.cols), dtype=bool)
+        for index in self._occupied:
+            cy, cx = divmod(index, self.cols)
+            occupied[max(0, cy - 1):cy + 2, max(0, cx - 1):cx + 2] = True
+
+        cx = np.clip(xs // self.cell_size, 0, self.cols - 1).astype(np.intp)
+        cy = np.clip(ys // self.cell_size, 0, self.rows - 1).astype(np.intp)
+        return occupied[cy, cx]
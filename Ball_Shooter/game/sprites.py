@@ -0,0 +1,74 @@
+import math
+import pygame
+import pygame.gfxdraw
+from config import *
+
+BARREL_LENGTH = 40
+BARREL_WIDTH = 6
+HEALTH_BAR_SIZE = (50, 6)
+# Transparent color of colorkeyed sprites; not used by anything drawn
+COLORKEY = (1, 2, 3)
+
+class SpriteAtlas:
+    """Pre-rendered anti-aliased circles, rotated barrels and health bars
+
+    Sprites are colorkeyed rather than per-pixel alpha, which blits several
+    times faster; circle edges are anti-aliased against the white map they
+    are nearly always drawn over.
+    """
+    
+    def __init__(self, barrel_angles=BARREL_ANGLES):
+        self.circles = {}
+        self.barrel_angles = barrel_angles
+        self.barrels = [self._render_barrel(i * 360 / barrel_angles) for i in range(barrel_angles)]
+        self.health_back = self._solid(RED, HEALTH_BAR_SIZE)
+        self.health_front = self._solid(GREEN, HEALTH_BAR_SIZE)
+        
+        for color in PLAYER_COLORS:
+            self.circle(color, PLAYER_RADIUS)
+            self.circle(color, BULLET_RADIUS)
+        self.circle(GRAY, PLAYER_RADIUS)
+    
+    @staticmethod
+    def _finish(surface, colorkey=None):
+        """Set up fast blitting, converting to the display's format when there is one"""
+        if colorkey is not None:
+            surface.set_colorkey(colorkey, pygame.RLEACCEL)
+        try:
+            return surface.convert()
+        except pygame.error:
+            return surface
+    
+    def _solid(self, color, size):
+        surface = pygame.Surface(size)
+        surface.fill(color)
+        return self._finish(surface)
+    
+    def circle(self, color, radius):
+        """Filled circle sprite; colors outside the palette are rendered on first use"""
+        key = (tuple(color), radius)
+        sprite = self.circles.get(key)
+        if sprite is None:
+            size = radius * 2 + 1
+            shape = pygame.Surface((size, size), pygame.SRCALPHA)
+            pygame.gfxdraw.aacircle(shape, radius, radius, radius, key[0])
+            pygame.gfxdraw.filled_circle(shape, radius, radius, radius, key[0])
+            
+            # Blend the soft edge into white and key out everything the circle does not touch
+            sprite = pygame.mask.from_surface(shape, 1).to_surface(setcolor=WHITE, unsetcolor=COLORKEY)
+            sprite.blit(shape, (0, 0))
+            sprite = self.circles[key] = self._finish(sprite, COLORKEY)
+        return sprite
+    
+    def _render_barrel(self, angle):
+        half = BARREL_LENGTH + BARREL_WIDTH
+        sprite = pygame.Surface((half * 2 + 1, half * 2 + 1))
+        sprite.fill(COLORKEY)
+        rad = math.radians(-angle)
+        end = (half + math.cos(rad) * BARREL_LENGTH, half + math.sin(rad) * BARREL_LENGTH)
+        pygame.draw.line(sprite, GRAY, (half, half), end, BARREL_WIDTH)
+        return self._finish(sprite, COLORKEY)
+    
+    def barrel(self, angle):
+        """Barrel sprite for the nearest pre-rendered angle, centered on the player"""
+        return self.barrels[round(angle * self.barrel_angles / 360) % self.barrel_angles]
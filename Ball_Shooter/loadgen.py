@@ -0,0 +1,316 @@
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+import pygame
+from config import *
+from game.entities import MOVE_KEYS, Player
+from game.prediction import InputPredictor
+from network.client import GameClient
+from network.protocol import FRAME_HEADER, decode_message
+from network.recording import ReplayReader
+from network.udp import UdpGameClient
+
+class LoadBot:
+    """Headless client that moves, aims and shoots along a scripted or random path"""
+
+    def __init__(self, index, pattern="random", fire_rate=2.0, seed=None, transport=TRANSPORT,
+                 control=CONTROL_MODE):
+        self.index = index
+        self.pattern = pattern
+        self.fire_rate = fire_rate
+        self.rng = random.Random(seed)
+        self.client = UdpGameClient() if transport == "udp" else GameClient()
+        self.player = Player(
+            # The process id keeps bots of separate loadgen runs on one server apart
+            f"bot{os.getpid()}-{index}",
+            self.rng.randint(50, MAP_WIDTH - 50),
+            self.rng.randint(50, MAP_HEIGHT - 50),
+            PLAYER_COLORS[index % len(PLAYER_COLORS)],
+            f"Bot {index}"
+        )
+        self.predictor = InputPredictor(self.player) if control == "input" else None
+        self.keys = {key: False for key in MOVE_KEYS}
+        self.new_bullets = []
+        self.lock = threading.Lock()
+        self.heading_until = 0
+        self.phase = self.rng.uniform(0, 2 * math.pi)
+
+        self.rtts = []
+        self.snapshots = 0
+        self.first_tick = None
+        self.last_tick = None
+        self.disconnected = False
+
+    def connect(self, host, port, room=None):
+        """Connect and start receiving snapshots"""
+        if not self.client.connect(host, port, room):
+            return False
+        self.client.start_receiving(self._on_message, self._on_disconnect)
+        return True
+
+    def _on_message(self, msg):
+        """Record snapshot and latency statistics"""
+        if "pong" in msg:
+            with self.lock:
+                self.rtts.append(time.perf_counter() - msg["pong"])
+            return
+        if "input_ack" in msg:
+            if self.predictor:
+                self.predictor.acknowledge(msg["input_ack"], msg["x"], msg["y"])
+            return
+
+        with self.lock:
+            self.snapshots += 1
+            if self.first_tick is None:
+                self.first_tick = msg["tick"]
+            self.last_tick = msg["tick"]
+
+        pdata = msg["players"].get(self.player.id)
+        if pdata is not None:
+            self.player.hp = pdata["hp"]
+            self.player.alive = pdata.get("alive", True)
+            if not self.player.alive and not self.predictor:
+                self.player.x, self.player.y = pdata["x"], pdata["y"]
+
+    def _on_disconnect(self):
+        self.disconnected = True
+
+    def _steer(self, now):
+        """Choose movement keys and aim for this step"""
+        if self.pattern == "circle":
+            angle = now * 1.5 + self.phase
+            dx, dy = -math.sin(angle), math.cos(angle)
+            self.keys[pygame.K_d], self.keys[pygame.K_a] = dx > 0.3, dx < -0.3
+            self.keys[pygame.K_s], self.keys[pygame.K_w] = dy > 0.3, dy < -0.3
+            self.player.angle = math.degrees(angle) % 360
+        elif now >= self.heading_until:
+            for key in MOVE_KEYS:
+                self.keys[key] = self.rng.random() < 0.35
+            self.player.angle = self.rng.uniform(0, 360)
+            self.heading_until = now + self.rng.uniform(0.3, 1.5)
+
+    def step(self, now, dt):
+        """Advance the bot's own simulation by one send interval"""
+        if not self.player.alive:
+            self.client.send_respawn_request(self.player.id)
+            return
+
+        if self.predictor:
+            self.predictor.reconcile()
+        self._steer(now)
+        fire = False
+        if self.rng.random() < self.fire_rate * dt:
+            bullet = self.player.shoot()
+            if bullet and self.predictor:
+                fire = True
+            elif bullet:
+                self.new_bullets.append(bullet.to_dict())
+
+        # Player.move advances one 60 Hz frame per call
+        for _ in range(max(1, round(dt * 60))):
+            self.player.move(self.keys)
+            if self.predictor:
+                self.predictor.record(self.keys, fire)
+                fire = False
+
+    def send(self):
+        """Send the bot's state and any bullets fired since the last send, or its
+        unacknowledged inputs"""
+        if self.predictor:
+            if not self.predictor.acked:
+                self.client.send_player_update(self.player, [])
+            self.client.send_inputs(self.player.id, self.predictor.outgoing(self.client.input_redundancy))
+        elif self.client.send_player_update(self.player, self.new_bullets):
+            self.new_bullets.clear()
+
+    def ping(self):
+        self.client.send_ping(time.perf_counter())
+
+    def take_stats(self, elapsed):
+        """Return and reset statistics gathered over the last interval"""
+        with self.lock:
+            rtts, self.rtts = self.rtts, []
+            snapshots, self.snapshots = self.snapshots, 0
+            ticks = (self.last_tick - self.first_tick) if self.first_tick is not None else 0
+            self.first_tick = self.last_tick = None
+        sent, self.client.bytes_sent = self.client.bytes_sent, 0
+        received, self.client.bytes_received = self.client.bytes_received, 0
+
+        return {
+            "bot": self.player.id,
+            "connected": self.client.connected,
+            "rtt_ms": 1000 * sum(rtts) / len(rtts) if rtts else None,
+            "rtt_max_ms": 1000 * max(rtts) if rtts else None,
+            "snapshots_per_s": snapshots / elapsed,
+            "server_ticks_per_s": ticks / elapsed,
+            "bytes_in_per_s": received / elapsed,
+            "bytes_out_per_s": sent / elapsed
+        }
+
+class ReplayBot(LoadBot):
+    """Headless client that resends one recorded client's frames at their recorded times"""
+
+    def __init__(self, index, frames, sim_rate, transport=TRANSPORT):
+        super().__init__(index, transport=transport, control="state")
+        # (seconds from the start of the replay, frame or None for the recorded leave)
+        self.frames = [(tick / sim_rate, frame) for tick, frame in frames]
+        self.next_frame = 0
+        self.started = None
+        self.due = []
+
+        # Track the recorded player so its snapshots feed the stats
+        for _, frame in self.frames:
+            if frame is not None:
+                _, msg_type = FRAME_HEADER.unpack_from(frame)
+                msg = decode_message(msg_type, frame[FRAME_HEADER.size:])
+                pid = next(iter(msg.get("players", ())), None) or msg.get("player_id")
+                if pid:
+                    self.player.id = pid
+                    break
+
+    def step(self, now, dt):
+        """Collect the frames whose recorded time has come"""
+        if self.started is None:
+            self.started = now
+        elapsed = now - self.started
+        while self.next_frame < len(self.frames) and self.frames[self.next_frame][0] <= elapsed:
+            self.due.append(self.frames[self.next_frame][1])
+            self.next_frame += 1
+
+    def send(self):
+        """Send the due frames together, then leave if the recorded client left"""
+        leave = None in self.due
+        frames = self.due[:self.due.index(None)] if leave else self.due
+        if frames:
+            self.client.send_data(b"".join(frames))
+        self.due = []
+        if leave:
+            self.client.disconnect()
+            self.disconnected = True
+
+def replay_bots(path, transport):
+    """One ReplayBot per client in a recorded match, timed from its first recorded message"""
+    reader = ReplayReader(path)
+    frames = {}
+    first = None
+    for record in reader.ticks():
+        for client, frame in record.commands:
+            if first is None:
+                first = record.tick
+            frames.setdefault(client, []).append((record.tick - first, frame))
+    sim_rate = reader.sim_rate
+    reader.close()
+    return [ReplayBot(i, client_frames, sim_rate, transport)
+            for i, client_frames in enumerate(frames.values())]
+
+def summarize(stats):
+    """Aggregate per-bot statistics for one report interval"""
+    def mean(values):
+        values = [v for v in values if v is not None]
+        return sum(values) / len(values) if values else None
+
+    return {
+        "bots": len(stats),
+        "connected": sum(1 for s in stats if s["connected"]),
+        "rtt_ms": mean(s["rtt_ms"] for s in stats),
+        "rtt_max_ms": max((s["rtt_max_ms"] for s in stats if s["rtt_max_ms"] is not None), default=None),
+        "snapshots_per_s": mean(s["snapshots_per_s"] for s in stats),
+        "server_ticks_per_s": mean(s["server_ticks_per_s"] for s in stats),
+        "bytes_in_per_s": mean(s["bytes_in_per_s"] for s in stats),
+        "bytes_out_per_s": mean(s["bytes_out_per_s"] for s in stats)
+    }
+
+def format_summary(elapsed, summary):
+    def fmt(value, spec):
+        return "-" if value is None else format(value, spec)
+
+    return (f"[{elapsed:6.1f}s] bots {summary['connected']}/{summary['bots']}  "
+            f"rtt {fmt(summary['rtt_ms'], '.1f')} ms (max {fmt(summary['rtt_max_ms'], '.1f')})  "
+            f"snapshots {fmt(summary['snapshots_per_s'], '.1f')}/s  "
+            f"ticks {fmt(summary['server_ticks_per_s'], '.1f')}/s  "
+            f"in {fmt(summary['bytes_in_per_s'], '.0f')} B/s  "
+            f"out {fmt(summary['bytes_out_per_s'], '.0f')} B/s")
+
+def run(args):
+    """Connect the bots and drive them until the duration elapses"""
+    if args.replay:
+        candidates = replay_bots(args.replay, args.transport)
+    else:
+        candidates = (LoadBot(i, args.pattern, args.fire_rate, None if args.seed is None else args.seed + i,
+                              args.transport, args.control)
+                      for i in range(args.bots))
+
+    bots = []
+    for bot in candidates:
+        if not bot.connect(args.host, args.port, args.room):
+            break
+        bots.append(bot)
+        if args.ramp:
+            time.sleep(args.ramp)
+
+    if not bots:
+        print("No bots could connect")
+        return
+
+    interval = 1 / args.rate
+    start = last_report = last_ping = time.perf_counter()
+    next_send = start
+    while time.perf_counter() - start < args.duration:
+        now = time.perf_counter()
+        for bot in bots:
+            if not bot.disconnected:
+                bot.step(now, interval)
+                bot.send()
+
+        if now - last_ping >= args.ping_interval:
+            for bot in bots:
+                bot.ping()
+            last_ping = now
+
+        if now - last_report >= args.report_interval:
+            elapsed = now - last_report
+            stats = [bot.take_stats(elapsed) for bot in bots]
+            report = {"time": now - start, "summary": summarize(stats)}
+            if args.json:
+                if args.per_bot:
+                    report["bots"] = stats
+                print(json.dumps(report), flush=True)
+            else:
+                print(format_summary(report["time"], report["summary"]), flush=True)
+            last_report = now
+
+        next_send += interval
+        time.sleep(max(0, next_send - time.perf_counter()))
+
+    for bot in bots:
+        bot.client.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless load generator for the Ball Shooter server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--transport", choices=("tcp", "udp"), default=TRANSPORT)
+    parser.add_argument("--control", choices=("state", "input"), default=CONTROL_MODE,
+                        help="send positions or input commands")
+    parser.add_argument("--room", default=None, help="lobby room to join instead of being placed")
+    parser.add_argument("--replay", default=None, metavar="FILE",
+                        help="resend the client messages of a recorded match instead of running bots")
+    parser.add_argument("--bots", type=int, default=10, help="number of simulated clients")
+    parser.add_argument("--rate", type=float, default=60, help="player updates sent per second per bot")
+    parser.add_argument("--fire-rate", type=float, default=2.0, help="shots attempted per second per bot")
+    parser.add_argument("--pattern", choices=("random", "circle"), default="random")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds between bot connections")
+    parser.add_argument("--ping-interval", type=float, default=0.5)
+    parser.add_argument("--report-interval", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print machine-readable reports")
+    parser.add_argument("--per-bot", action="store_true", help="include per-bot stats in JSON reports")
+    run(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
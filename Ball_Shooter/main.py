@@ -1,13 +1,21 @@
 import pygame
+import queue
 import threading
 import time
 import random
 from config import *
-from game.entities import Player, Camera
+from game.entities import Player, BulletPool, Camera
+from game.interpolation import InterpolationBuffer, ServerClock
+from game.prediction import InputPredictor
+from network.uplink import UplinkScheduler
 from game.renderer import GameRenderer
 from game.ui import GameUI
 from network.client import GameClient
 from network.server import GameServer
+from network.event_server import EventLoopServer
+from network.lobby import LobbyServer
+from network.split_server import SplitServer
+from network.udp import UdpGameClient, UdpGameServer
 
 class BallShooter:
     def __init__(self):
@@ -25,7 +33,17 @@ class BallShooter:
         self.my_player = None
         self.players = {}
         self.bullets = {}
+        self.bullet_pool = BulletPool()
+        self.bullet_spawns = {}
+        self.bullet_removals = {}
+        self.drawn_bullets = []
+        self.server_clock = ServerClock()
+        self.network_updates = queue.SimpleQueue()
+        self.interpolation = InterpolationBuffer()
         self.new_bullets = []
+        self.predictor = None
+        self.uplink = UplinkScheduler()
+        self.fire_requested = False
         self.used_colors = set()
         self.running = True
         self.connected = True
@@ -48,11 +66,18 @@ class BallShooter:
     def _host_game(self):
         """Setup hosting"""
         self.is_host = True
-        self.server = GameServer()
+        if TRANSPORT == "udp":
+            self.server = UdpGameServer()
+        elif SERVER_MODE == "lobby":
+            self.server = LobbyServer()
+        elif SERVER_MODE == "split":
+            self.server = SplitServer()
+        else:
+            self.server = EventLoopServer() if SERVER_MODE == "selectors" else GameServer()
         if not self.server.start():
             return False
         
-        self.client = GameClient()
+        self.client = UdpGameClient() if TRANSPORT == "udp" else GameClient()
         time.sleep(0.5) 
         return self.client.connect("localhost")
     
@@ -62,7 +87,7 @@ class BallShooter:
         if host_ip is None:
             return False
         
-        self.client = GameClient()
+        self.client = UdpGameClient() if TRANSPORT == "udp" else GameClient()
         return self.client.connect(host_ip)
     
     def setup_player(self):
@@ -87,48 +112,117 @@ class BallShooter:
             player_name
         )
         self.players[self.my_player.id] = self.my_player
+        if CONTROL_MODE == "input":
+            self.predictor = InputPredictor(self.my_player)
         
         return True
     
-    def handle_network_updates(self, game_state):
-        """Handle incoming network updates"""
-        if "used_colors" in game_state:
-            self.used_colors = set(tuple(c) for c in game_state["used_colors"])
-        
-        if "players" in game_state:
-            current_pids = set(game_state["players"].keys())
-            for pid in list(self.players.keys()):
-                if pid not in current_pids and pid != self.my_player.id:
-                    del self.players[pid]
-            
-            for pid, pdata in game_state["players"].items():
-                if pid == self.my_player.id:
-                    # For our own player, accept server's authoritative state for critical values
-                    old_x, old_y = self.my_player.x, self.my_player.y
-                    
-                    self.my_player.hp = pdata["hp"]
-                    self.my_player.alive = pdata.get("alive", True)
-                    self.my_player.kills = pdata.get("kills", 0)
-                    
-                    # If we died and respawned on server, accept new position
-                    if not self.my_player.alive or (abs(pdata["x"] - old_x) > 100 or abs(pdata["y"] - old_y) > 100):
-                        self.my_player.x = pdata["x"]
-                        self.my_player.y = pdata["y"]
-                    
+    def handle_network_updates(self, changes):
+        """Hand server changes from the receive thread to the game loop"""
+        if "tick" in changes:
+            # Arrival times are only accurate where the snapshot arrives
+            self.server_clock.observe(changes["tick"])
+        self.network_updates.put(changes)
+    
+    def apply_network_updates(self):
+        """Apply the server changes received since the last frame, in order"""
+        while True:
+            try:
+                changes = self.network_updates.get_nowait()
+            except queue.Empty:
+                return
+            self.apply_changes(changes)
+    
+    def apply_changes(self, changes):
+        """Apply the changes since the last applied server snapshot"""
+        if "input_ack" in changes:
+            if self.predictor:
+                self.predictor.acknowledge(changes["input_ack"], changes["x"], changes["y"])
+            return
+        
+        tick = changes["tick"]
+        
+        if "used_colors" in changes:
+            self.used_colors = set(tuple(c) for c in changes["used_colors"])
+        
+        for pid in changes["removed_players"]:
+            if pid != self.my_player.id:
+                self.players.pop(pid, None)
+                self.interpolation.remove(pid)
+        
+        positions = {}
+        for pid, pdata in changes["players"].items():
+            if pid == self.my_player.id:
+                # For our own player, accept server's authoritative state for critical values
+                old_x, old_y = self.my_player.x, self.my_player.y
+                
+                self.my_player.hp = pdata["hp"]
+                self.my_player.alive = pdata.get("alive", True)
+                self.my_player.kills = pdata.get("kills", 0)
+                
+                # If we died and respawned on server, accept new position; with input
+                # prediction the position comes from input acks instead
+                if self.predictor:
                     continue
+                if not self.my_player.alive or (abs(pdata["x"] - old_x) > 100 or abs(pdata["y"] - old_y) > 100):
+                    self.my_player.x = pdata["x"]
+                    self.my_player.y = pdata["y"]
                 
-                if pid not in self.players:
-                    self.players[pid] = Player(
-                        pid, pdata["x"], pdata["y"], 
-                        pdata["color"], pdata.get("name", "Player")
-                    )
-                self.players[pid].update_from_dict(pdata)
-        
-        if "bullets" in game_state:
-            from game.entities import Bullet
-            self.bullets.clear()
-            for bid, bdata in game_state["bullets"].items():
-                self.bullets[bid] = Bullet.from_dict(bdata)
+                continue
+            
+            if pid not in self.players:
+                self.players[pid] = Player(
+                    pid, pdata["x"], pdata["y"], 
+                    pdata["color"], pdata.get("name", "Player")
+                )
+            self.players[pid].update_from_dict(pdata)
+            positions[pid] = (pdata["x"], pdata["y"], pdata["angle"])
+        self.interpolation.record(tick, positions)
+        
+        # Bullets fly in straight lines, so only spawns and removals are sent; they are
+        # placed at draw time and dropped once the render tick reaches their removal
+        for bid in changes["removed_bullets"]:
+            if bid in self.bullets:
+                self.bullet_removals[bid] = tick
+        
+        for bid, bdata in changes["bullets"].items():
+            self.bullet_spawns[bid] = (bdata["x"], bdata["y"], bdata["tick"])
+            old = self.bullets.get(bid)
+            self.bullets[bid] = self.bullet_pool.acquire(bdata)
+            if old is not None:
+                self.bullet_pool.release(old)
+    
+    def interpolate_remote(self):
+        """Place remote players and bullets where they were at the delayed render tick"""
+        tick = self.server_clock.render_tick()
+        if tick is None:
+            return
+        
+        for pid, player in list(self.players.items()):
+            if pid != self.my_player.id:
+                sample = self.interpolation.sample(pid, tick)
+                if sample is not None:
+                    player.x, player.y, player.angle = sample
+        
+        # Our own shots are drawn without the delay so firing feels immediate
+        own_tick = self.server_clock.render_tick(delay=0)
+        drawn = self.drawn_bullets
+        drawn.clear()
+        for bid, bullet in list(self.bullets.items()):
+            at = own_tick if bullet.owner_id == self.my_player.id else tick
+            removed = self.bullet_removals.get(bid)
+            if removed is not None and at >= removed:
+                self.bullets.pop(bid, None)
+                self.bullet_spawns.pop(bid, None)
+                self.bullet_removals.pop(bid, None)
+                self.bullet_pool.release(bullet)
+                continue
+            
+            x, y, spawn_tick = self.bullet_spawns[bid]
+            if at >= spawn_tick:
+                bullet.x, bullet.y = x, y
+                bullet.advance(at - spawn_tick)
+                drawn.append(bullet)
     
     def handle_disconnect(self):
         """Handle network disconnection"""
@@ -141,7 +235,10 @@ class BallShooter:
                 self.running = False
             elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 bullet = self.my_player.shoot()
-                if bullet:
+                if bullet and self.predictor:
+                    # The server fires for us; shoot() only applied the cooldown
+                    self.fire_requested = True
+                elif bullet:
                     self.new_bullets.append(bullet.to_dict())
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_r and not self.my_player.alive:
@@ -152,24 +249,26 @@ class BallShooter:
     def update_game_state(self):
         """Update local game state"""
         keys = pygame.key.get_pressed()
+        if self.predictor:
+            self.predictor.reconcile()
         
         # Only update movement and aiming if player is alive
         if self.my_player.alive:
             self.my_player.move(keys)
             self.my_player.aim(self.camera)
         
+        if self.predictor:
+            self.predictor.record(keys, self.fire_requested)
+            self.fire_requested = False
+        
         self.camera.update(self.my_player.x, self.my_player.y)
     
     def render_game(self):
         """Render the game"""
         self.renderer.draw_map(self.camera)
         
-        for player in self.players.values():
-            if player.connected:
-                self.renderer.draw_player(player, self.camera)
-        
-        for bullet in self.bullets.values():
-            self.renderer.draw_bullet(bullet, self.camera)
+        self.renderer.draw_players([p for p in self.players.values() if p.connected], self.camera)
+        self.renderer.draw_bullets(self.drawn_bullets, self.camera)
         
         self.renderer.draw_minimap(self.my_player, self.players)
         self.renderer.draw_leaderboard(self.my_player, self.players)
@@ -180,16 +279,35 @@ class BallShooter:
         if not self.my_player.alive:
             self.renderer.draw_respawn_message()
         
-        pygame.display.flip()
+        self.renderer.present()
     
     def send_updates(self):
-        """Send updates to server"""
-        if self.client and self.connected:
+        """Send updates to server when the uplink scheduler says they are due"""
+        if not self.client or not self.connected:
+            return
+        
+        if self.predictor:
+            state = self.predictor.sequence
+            if not self.uplink.due(state):
+                return
+            inputs = self.predictor.outgoing(self.client.input_redundancy)
+            success = True
+            # Announce the player until the server acks its inputs, and as the keepalive
+            if not self.predictor.acked or not inputs:
+                success = self.client.send_player_update(self.my_player, [])
+            success = success and self.client.send_inputs(self.my_player.id, inputs)
+        else:
+            state = (self.my_player.x, self.my_player.y, self.my_player.angle)
+            # Bullets fired since the last send ride along with the next update
+            if not self.uplink.due(state, force=bool(self.new_bullets)):
+                return
             success = self.client.send_player_update(self.my_player, self.new_bullets)
-            if success:
-                self.new_bullets.clear()
-            else:
-                self.connected = False
+        
+        if success:
+            self.new_bullets.clear()
+            self.uplink.sent(state)
+        else:
+            self.connected = False
     
     def run(self):
         """Main game loop"""
@@ -210,7 +328,9 @@ class BallShooter:
                 break
             
             self.handle_events()
+            self.apply_network_updates()
             self.update_game_state()
+            self.interpolate_remote()
             self.render_game()
             self.send_updates()
             
@@ -1,22 +1,40 @@
 import socket
-import json
 import threading
 from config import PORT
+from network.protocol import (ProtocolError, client_handshake, decode_message, encode_ack,
+                              encode_inputs, encode_new_bullets, encode_ping,
+                              encode_player_update, encode_respawn_request)
+from network.snapshots import SnapshotReceiver
+from network.stream import StreamReader
+from utils.helpers import set_low_latency
 
 class GameClient:
+    # The stream never loses input commands, so none are repeated
+    input_redundancy = 0
+    
     def __init__(self):
         self.socket = None
         self.connected = False
         self.game_state_callback = None
         self.disconnect_callback = None
+        self.reader = None
+        self.snapshots = SnapshotReceiver()
+        self.send_lock = threading.Lock()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.room = None
         
-    def connect(self, host_ip):
+    def connect(self, host_ip, port=PORT, room=None):
         """Connect to game server"""
         try:
             self.socket = socket.socket()
-            self.socket.connect((host_ip, PORT))
+            self.socket.connect((host_ip, port))
+            set_low_latency(self.socket)
+            self.reader = StreamReader(self.socket)
+            welcome = client_handshake(self.socket, self.reader, room)
+            self.room = welcome.get("room")
             self.connected = True
-            print(f"Connected to {host_ip}:{PORT}")
+            print(f"Connected to {host_ip}:{port}" + (f" (room {self.room})" if self.room else ""))
             return True
         except Exception as e:
             print(f"Failed to connect: {e}")
@@ -33,13 +51,14 @@ class GameClient:
             self.socket = None
     
     def send_data(self, data):
-        """Send data to server"""
+        """Send encoded frames to server"""
         if not self.socket or not self.connected:
             return False
         
         try:
-            message = json.dumps(data) + "\n"
-            self.socket.sendall(message.encode())
+            with self.send_lock:
+                self.socket.sendall(data)
+                self.bytes_sent += len(data)
             return True
         except:
             self.connected = False
@@ -48,13 +67,34 @@ class GameClient:
     def receive_data(self):
         """Receive data from server"""
         try:
-            data = self.socket.recv(4096).decode()
-            if not data:
+            received = self.reader.fill()
+            if not received:
+                self.connected = False
                 return []
-            return [json.loads(msg) for msg in data.split('\n') if msg.strip()]
+            self.bytes_received += received
+            return self._decode_frames(self.reader.frames())
+        except ProtocolError:
+            self.connected = False
+            return []
         except:
             return []
     
+    def _decode_frames(self, frames):
+        """Decode frames, apply snapshots and acknowledge the newest one applied"""
+        messages = []
+        ack = None
+        for msg_type, payload in frames:
+            msg = decode_message(msg_type, payload)
+            if "tick" in msg:
+                msg = self.snapshots.apply(msg)
+                if msg is None:
+                    continue
+                ack = msg["tick"]
+            messages.append(msg)
+        if ack is not None:
+            self.send_data(encode_ack(ack))
+        return messages
+    
     def start_receiving(self, game_state_callback, disconnect_callback=None):
         """Start receiving game state updates"""
         self.game_state_callback = game_state_callback
@@ -78,15 +118,21 @@ class GameClient:
     
     def send_player_update(self, player, new_bullets):
         """Send player state and new bullets to server"""
-        data = {
-            "players": {player.id: player.to_dict()},
-            "new_bullets": [b.to_dict() if hasattr(b, 'to_dict') else b for b in new_bullets]
-        }
+        data = encode_player_update(player.to_dict(), player.id)
+        if new_bullets:
+            data += encode_new_bullets([b.to_dict() if hasattr(b, 'to_dict') else b for b in new_bullets])
         return self.send_data(data)
     
+    def send_inputs(self, player_id, inputs):
+        """Send input commands to server"""
+        if not inputs:
+            return self.connected
+        return self.send_data(encode_inputs(player_id, inputs))
+    
     def send_respawn_request(self, player_id):
         """Send respawn request to server"""
-        data = {
-            "respawn_request": player_id
-        }
-        return self.send_data(data)
\ No newline at end of file
+        return self.send_data(encode_respawn_request(player_id))
+    
+    def send_ping(self, timestamp):
+        """Send a latency probe; the server echoes it back as {"pong": timestamp}"""
+        return self.send_data(encode_ping(timestamp))
\ No newline at end of file
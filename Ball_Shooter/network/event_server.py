@@ -0,0 +1,176 @@
+import json
+import selectors
+import threading
+from config import *
+from network.outbound import SendQueue
+from network.protocol import ProtocolError, MAX_HANDSHAKE_LENGTH, check_hello, parse_handshake
+from network.server import GameServer
+from network.stream import StreamReader
+from utils.helpers import set_low_latency
+
+class Connection:
+    """Buffers and bookkeeping for one client of the event loop server"""
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.reader = StreamReader(sock)
+        self.handshaken = False
+        self.queue = SendQueue()
+        self.events = selectors.EVENT_READ
+
+class EventLoopServer(GameServer):
+    """Game server that multiplexes every connection and the simulation on one thread"""
+
+    def __init__(self):
+        super().__init__()
+        self.selector = None
+        self.connections = {}
+
+    def start(self):
+        """Start the game server"""
+        try:
+            self._open_listener()
+            self._start_stats()
+            self._start_recording()
+            self.server_socket.setblocking(False)
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(self.server_socket, selectors.EVENT_READ, None)
+            self.running = True
+            print(f"Server started on port {PORT} (event loop)")
+
+            threading.Thread(target=self._event_loop, daemon=True).start()
+            return True
+        except Exception as e:
+            print(f"Failed to start server: {e}")
+            return False
+
+    def _event_loop(self):
+        """Serve sockets until the next tick is due, then step the simulation"""
+        self.scheduler.start()
+        while self.running:
+            try:
+                events = self.selector.select(self.scheduler.time_until_next())
+            except OSError:
+                break
+
+            for key, mask in events:
+                if key.data is None:
+                    self._accept()
+                    continue
+                conn = key.data
+                if mask & selectors.EVENT_READ:
+                    self._read(conn)
+                if mask & selectors.EVENT_WRITE and conn.sock in self.connections:
+                    self._flush(conn)
+
+            self._run_due_ticks()
+
+        self.selector.close()
+
+    def _accept(self):
+        """Accept every pending connection"""
+        while True:
+            try:
+                client_socket, addr = self.server_socket.accept()
+            except (BlockingIOError, OSError):
+                return
+            client_socket.setblocking(False)
+            set_low_latency(client_socket)
+            conn = Connection(client_socket, addr)
+            self.connections[client_socket] = conn
+            self.selector.register(client_socket, selectors.EVENT_READ, conn)
+            self.stats.register(client_socket, f"{addr[0]}:{addr[1]}")
+            print(f"Client connected from {addr}")
+
+    def _read(self, conn):
+        """Consume whatever the client has sent"""
+        try:
+            received = conn.reader.fill()
+        except BlockingIOError:
+            return
+        except ProtocolError:
+            self.stats.bad_frames += 1
+            received = 0
+        except OSError:
+            received = 0
+
+        if not received:
+            self._cleanup_client(conn.sock)
+            return
+
+        traffic = self.stats.client(conn.sock)
+        traffic.bytes_in += received
+        try:
+            if not conn.handshaken and not self._read_handshake(conn):
+                return
+            for msg_type, payload in conn.reader.frames():
+                traffic.messages_in += 1
+                self._handle_frame(conn.sock, msg_type, payload)
+        except (ProtocolError, KeyError, TypeError):
+            self.stats.bad_frames += 1
+            self._cleanup_client(conn.sock)
+
+    def _read_handshake(self, conn):
+        """Answer the JSON hello once it has arrived; returns True when the connection is ready"""
+        line = conn.reader.read_line(MAX_HANDSHAKE_LENGTH)
+        if line is None:
+            return False
+
+        try:
+            hello = parse_handshake(line)
+        except ProtocolError:
+            hello = None
+
+        reply = check_hello(hello)
+        self._queue(conn, (json.dumps(reply) + "\n").encode(), droppable=False)
+        if "error" in reply:
+            print(f"Handshake failed from {conn.addr}")
+            self._cleanup_client(conn.sock)
+            return False
+
+        conn.handshaken = True
+        self.clients.append(conn.sock)
+        return True
+
+    def _queue(self, conn, message, droppable=True):
+        """Add to a connection's send queue and send what the socket accepts"""
+        dropped = conn.queue.put(message, droppable)
+        if dropped:
+            self.stats.drop(conn.sock, dropped)
+        if conn.queue.stalled(SLOW_CLIENT_TIMEOUT):
+            print(f"Dropping client {conn.addr}: too far behind")
+            self._cleanup_client(conn.sock)
+            return
+        self._flush(conn)
+
+    def _flush(self, conn):
+        """Write as much queued data as the socket takes without blocking"""
+        try:
+            sent, messages = conn.queue.send_some(conn.sock)
+        except OSError:
+            self._cleanup_client(conn.sock)
+            return
+        traffic = self.stats.client(conn.sock)
+        traffic.bytes_out += sent
+        traffic.messages_out += messages
+
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if conn.queue else 0)
+        if events != conn.events:
+            conn.events = events
+            self.selector.modify(conn.sock, events, conn)
+
+    def _send(self, client, message, droppable=True):
+        """Queue an encoded message for one client"""
+        conn = self.connections.get(client)
+        if conn is not None:
+            self._queue(conn, message, droppable)
+
+    def _cleanup_client(self, client_socket):
+        """Clean up disconnected client"""
+        if self.connections.pop(client_socket, None) is not None:
+            try:
+                self.selector.unregister(client_socket)
+            except (KeyError, ValueError):
+                pass
+        super()._cleanup_client(client_socket)
@@ -0,0 +1,354 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import socket
+import threading
+import time
+from itertools import count
+from multiprocessing.reduction import recv_handle, send_handle
+from config import *
+from network.protocol import ProtocolError, check_hello, read_handshake, send_data
+from network.server import GameServer
+from network.stats import StatsServer
+from network.stream import StreamReader
+
+# Clients that have not finished the hello by then are dropped
+HANDSHAKE_TIMEOUT = 5.0
+MAX_ROOM_NAME = 32
+# Workers that die sooner than this after starting are not restarted; they would only die again
+WORKER_MIN_LIFETIME = 5.0
+
+# Workers start fresh rather than forking a process that may already run threads
+_context = multiprocessing.get_context("spawn")
+
+class RoomServer(GameServer):
+    """One match in a room worker; its clients arrive already handshaken by the lobby"""
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.reported_tick_time = 0.0
+        self.reported_at = time.monotonic()
+
+    def start(self):
+        """Start simulating; there is no listener of its own"""
+        self.running = True
+        threading.Thread(target=self._game_loop, daemon=True).start()
+        return True
+
+    def report(self):
+        """Metrics for the lobby; load is the share of one core spent ticking since the last report"""
+        tick_time = self.stats.phases["tick"]
+        now = time.monotonic()
+        load = (tick_time.total - self.reported_tick_time) / 1e6 / max(now - self.reported_at, 1e-6)
+        self.reported_tick_time, self.reported_at = tick_time.total, now
+
+        state = self.published
+        return {
+            "clients": len(self.clients),
+            "players": len(state["players"]) if state else 0,
+            "bullets": len(state["bullets"]) if state else 0,
+            "tick": self.tick,
+            "load": load,
+            "tick_p99_us": tick_time.percentile(0.99),
+            "dropped_messages": self.stats.dropped_messages,
+            "bad_frames": self.stats.bad_frames
+        }
+
+def run_room_worker(conn, report_interval=ROOM_REPORT_INTERVAL):
+    """Worker process entry point: host the rooms the lobby places here and report on them"""
+    rooms = {}
+    lock = threading.Lock()
+
+    def report():
+        while True:
+            time.sleep(report_interval)
+            with lock:
+                reports = {name: room.report() for name, room in rooms.items()}
+            try:
+                conn.send(("report", reports))
+            except (OSError, ValueError):
+                return
+
+    threading.Thread(target=report, daemon=True).start()
+    try:
+        while True:
+            command, name, *args = conn.recv()
+            if command == "adopt":
+                client_socket = socket.socket(fileno=recv_handle(conn))
+                client_socket.setblocking(True)
+                with lock:
+                    room = rooms.get(name)
+                    if room is None:
+                        room = rooms[name] = RoomServer(name)
+                        room.start()
+                room.adopt(client_socket, args[0])
+            elif command == "close":
+                with lock:
+                    room = rooms.pop(name, None)
+                if room is not None:
+                    room.stop()
+            elif command == "stop":
+                break
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+
+    for room in rooms.values():
+        room.stop()
+
+class RoomWorker:
+    """The lobby's handle on one worker process"""
+
+    def __init__(self, index):
+        self.index = index
+        self.started = time.monotonic()
+        self.conn, child = _context.Pipe()
+        self.process = _context.Process(target=run_room_worker, args=(child,),
+                                        name=f"room-worker-{index}", daemon=True)
+        self.process.start()
+        child.close()
+        self.lock = threading.Lock()
+        self.rooms = set()
+        self.load = 0.0
+
+    def send(self, *command, handle=None):
+        """Send a command, followed by a socket handle for the worker to take over"""
+        with self.lock:
+            self.conn.send(command)
+            if handle is not None:
+                send_handle(self.conn, handle, self.process.pid)
+
+    def stop(self):
+        try:
+            self.send("stop", None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+class Room:
+    """What the lobby knows about one room"""
+
+    def __init__(self, name, worker, named=False):
+        self.name = name
+        self.worker = worker
+        # Rooms clients asked for by name are never filled with strangers
+        self.named = named
+        self.clients = 0
+        self.metrics = {}
+        self.last_join = time.monotonic()
+        self.empty_since = None
+
+class LobbyServer:
+    """Front door on PORT that handshakes clients and hands them to rooms in worker processes
+
+    Each room is a separate match with its own GameServer simulation. Clients name a room in
+    their hello or are placed in the fullest numbered room with space; new rooms go to the least loaded
+    worker, and rooms left empty for ROOM_IDLE_TIMEOUT are closed.
+    """
+
+    def __init__(self, workers=ROOM_WORKERS, capacity=ROOM_CAPACITY):
+        self.worker_count = workers or os.cpu_count() or 1
+        self.capacity = capacity
+        self.server_socket = None
+        self.running = False
+        self.workers = []
+        self.rooms = {}
+        self.room_numbers = count(1)
+        self.lock = threading.Lock()
+        self.stats_server = None
+        self.started = time.time()
+
+    def start(self):
+        """Start the worker pool and accept clients"""
+        try:
+            self.server_socket = socket.socket()
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind(("0.0.0.0", PORT))
+            self.server_socket.listen(64)
+            self.workers = [RoomWorker(i) for i in range(self.worker_count)]
+            self.running = True
+            if STATS_PORT:
+                self.stats_server = StatsServer(self.get_stats, STATS_PORT)
+                self.stats_server.start()
+                print(f"Stats available at http://{STATS_HOST}:{STATS_PORT}/stats")
+            print(f"Lobby started on port {PORT} with {self.worker_count} room workers")
+
+            threading.Thread(target=self._accept_clients, daemon=True).start()
+            threading.Thread(target=self._monitor_workers, daemon=True).start()
+            return True
+        except Exception as e:
+            print(f"Failed to start lobby: {e}")
+            self.stop()
+            return False
+
+    def stop(self):
+        """Stop accepting clients and shut the workers down"""
+        self.running = False
+        if self.stats_server:
+            self.stats_server.stop()
+        if self.server_socket:
+            try:
+                self.server_socket.close()
+            except:
+                pass
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+
+    def _accept_clients(self):
+        """Accept incoming connections and admit each on its own thread"""
+        while self.running:
+            try:
+                self.server_socket.settimeout(1.0)
+                client_socket, addr = self.server_socket.accept()
+            except socket.timeout:
+                continue
+            except:
+                break
+            threading.Thread(target=self._admit, args=(client_socket, addr), daemon=True).start()
+
+    def _admit(self, client_socket, addr):
+        """Answer a client's hello, pick its room and pass the connection to that room's worker"""
+        try:
+            client_socket.settimeout(HANDSHAKE_TIMEOUT)
+            hello = read_handshake(StreamReader(client_socket))
+            reply = check_hello(hello)
+            room = None
+            if "error" not in reply:
+                room = self._assign(hello.get("room"))
+                if room is None and not self.workers:
+                    reply = {"error": "No room workers are running"}
+                elif room is None:
+                    reply = {"error": "Room is full or its name is invalid"}
+            if room is not None:
+                reply["room"] = room.name
+            send_data(client_socket, reply)
+
+            if room is not None:
+                # Blocking again before the worker inherits the socket
+                client_socket.settimeout(None)
+                room.worker.send("adopt", room.name, addr, handle=client_socket.fileno())
+                print(f"Client {addr} joined room {room.name}")
+        except (ProtocolError, OSError, ValueError) as e:
+            print(f"Could not admit {addr}: {e}")
+        finally:
+            # The worker holds its own copy of the socket now
+            client_socket.close()
+
+    def _assign(self, name=None):
+        """Room for a joining client: the named one, else the fullest numbered one with space"""
+        named = name is not None
+        with self.lock:
+            if not self.workers:
+                return None
+            if named:
+                if not isinstance(name, str) or not 0 < len(name) <= MAX_ROOM_NAME:
+                    return None
+                room = self.rooms.get(name)
+            else:
+                open_rooms = [room for room in self.rooms.values()
+                              if not room.named and room.clients < self.capacity]
+                room = max(open_rooms, key=lambda room: room.clients, default=None)
+                if room is None:
+                    name = str(next(self.room_numbers))
+                    while name in self.rooms:
+                        name = str(next(self.room_numbers))
+
+            if room is None:
+                worker = min(self.workers, key=lambda worker: (worker.load, len(worker.rooms)))
+                room = self.rooms[name] = Room(name, worker, named)
+                worker.rooms.add(name)
+            elif room.clients >= self.capacity:
+                return None
+
+            # Counted now so joins between reports do not overfill the room
+            room.clients += 1
+            room.last_join = time.monotonic()
+            return room
+
+    def _monitor_workers(self):
+        """Apply the workers' room reports and close rooms that have stayed empty"""
+        connections = {worker.conn: worker for worker in self.workers}
+        while self.running and connections:
+            for conn in multiprocessing.connection.wait(list(connections), timeout=1.0):
+                worker = connections[conn]
+                try:
+                    _, reports = conn.recv()
+                except (EOFError, OSError):
+                    del connections[conn]
+                    if self.running:
+                        print(f"Room worker {worker.process.name} exited")
+                        worker = self._replace_worker(worker)
+                        if worker is not None:
+                            connections[worker.conn] = worker
+                    continue
+                self._apply_reports(worker, reports)
+
+    def _apply_reports(self, worker, reports):
+        now = time.monotonic()
+        with self.lock:
+            worker.load = sum(metrics["load"] for metrics in reports.values())
+            for name in worker.rooms:
+                room = self.rooms[name]
+                # A room the worker never got a client for is reported as empty
+                room.metrics = reports.get(name, {})
+                # Joins since the report are not in it yet
+                if now - room.last_join > ROOM_REPORT_INTERVAL * 2:
+                    room.clients = room.metrics.get("clients", 0)
+                if room.clients:
+                    room.empty_since = None
+                elif room.empty_since is None:
+                    room.empty_since = now
+
+            # Joins since the report have already been counted in clients
+            idle = [room for room in self.rooms.values() if room.worker is worker and not room.clients and
+                    room.empty_since is not None and now - room.empty_since > ROOM_IDLE_TIMEOUT]
+            for room in idle:
+                del self.rooms[room.name]
+                worker.rooms.discard(room.name)
+                # Sent under the lock: a room recreated under the same name can only be
+                # assigned, and its first client adopted, after the close reached the worker
+                print(f"Closing idle room {room.name}")
+                worker.send("close", room.name)
+
+    def _replace_worker(self, worker):
+        """Drop the rooms of a worker that died and start a new one in its place; returns the
+        new worker, or None if the dead one is not restarted"""
+        with self.lock:
+            for name in worker.rooms:
+                self.rooms.pop(name, None)
+            worker.rooms.clear()
+            if worker in self.workers:
+                self.workers.remove(worker)
+        worker.stop()
+
+        if time.monotonic() - worker.started < WORKER_MIN_LIFETIME:
+            print(f"Not restarting room worker {worker.process.name}; it died soon after starting")
+            return None
+        try:
+            replacement = RoomWorker(worker.index)
+        except OSError as e:
+            print(f"Could not restart room worker {worker.process.name}: {e}")
+            return None
+        with self.lock:
+            if not self.running:
+                replacement.stop()
+                return None
+            self.workers.append(replacement)
+        print(f"Restarted room worker {replacement.process.name}")
+        return replacement
+
+    def get_stats(self):
+        """Machine-readable snapshot of lobby, worker and room health"""
+        with self.lock:
+            return {
+                "uptime": time.time() - self.started,
+                "workers": [{"name": worker.process.name, "pid": worker.process.pid,
+                             "load": worker.load, "rooms": sorted(worker.rooms)}
+                            for worker in self.workers],
+                "rooms": {name: dict(room.metrics, clients=room.clients, worker=room.worker.process.name)
+                          for name, room in self.rooms.items()}
+            }
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import deque
+from config import MAX_QUEUED_SNAPSHOTS
+
+class SendQueue:
+    """Bounded queue of encoded messages for one client
+
+    Snapshots are droppable: once max_snapshots are waiting, the oldest is
+    discarded for the new one, since every delta is encoded against the
+    client's acked baseline rather than the previous message. Other messages
+    are always kept. Messages are shared bytes objects and are never copied.
+    """
+
+    def __init__(self, max_snapshots=MAX_QUEUED_SNAPSHOTS):
+        self.items = deque()
+        self.max_snapshots = max_snapshots
+        self.snapshots = 0
+        # Bytes of the head message already written by send_some
+        self.offset = 0
+        self.last_progress = time.monotonic()
+        self.ready = threading.Condition()
+        self.closed = False
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, message, droppable=True):
+        """Queue a message; returns how many stale snapshots were dropped to make room"""
+        if not self.items:
+            self.last_progress = time.monotonic()
+        dropped = 0
+        if droppable:
+            while self.snapshots >= self.max_snapshots and self._drop_oldest():
+                dropped += 1
+            self.snapshots += 1
+        self.items.append((message, droppable))
+        return dropped
+
+    def _drop_oldest(self):
+        for i, (_, droppable) in enumerate(self.items):
+            # A partly written message has to be finished
+            if droppable and not (i == 0 and self.offset):
+                del self.items[i]
+                self.snapshots -= 1
+                return True
+        return False
+
+    def pop(self):
+        """Remove and return the head message"""
+        message, droppable = self.items.popleft()
+        if droppable:
+            self.snapshots -= 1
+        self.offset = 0
+        self.last_progress = time.monotonic()
+        return message
+
+    def send_some(self, sock):
+        """Write what a non-blocking socket accepts; returns (bytes, messages) completed"""
+        written = completed = 0
+        while self.items:
+            message = self.items[0][0]
+            try:
+                sent = sock.send(memoryview(message)[self.offset:])
+            except BlockingIOError:
+                break
+            written += sent
+            self.offset += sent
+            if self.offset < len(message):
+                break
+            self.pop()
+            completed += 1
+        if written:
+            self.last_progress = time.monotonic()
+        return written, completed
+
+    def stalled(self, timeout):
+        """Whether messages have been waiting with no progress for longer than timeout"""
+        return bool(self.items) and time.monotonic() - self.last_progress > timeout
+
+    def close(self):
+        with self.ready:
+            self.closed = True
+            self.ready.notify()
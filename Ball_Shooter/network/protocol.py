@@ -0,0 +1,391 @@
+import json
+import struct
+from utils.helpers import send_data
+
+PROTOCOL_NAME = "ball-shooter"
+PROTOCOL_VERSION = 6
+MAX_HANDSHAKE_LENGTH = 1024
+
+# Every frame is a 4-byte payload length and a 1-byte message type
+FRAME_HEADER = struct.Struct("!IB")
+
+MSG_PLAYER_UPDATE = 1
+MSG_NEW_BULLETS = 2
+MSG_RESPAWN_REQUEST = 3
+MSG_SNAPSHOT = 4
+MSG_ACK = 5
+MSG_DELTA = 6
+MSG_PING = 7
+MSG_PONG = 8
+# Only used by the UDP transport, where there is no stream to carry the JSON handshake
+MSG_HELLO = 9
+MSG_DISCONNECT = 10
+MSG_INPUT = 11
+MSG_INPUT_ACK = 12
+
+FLAG_ALIVE = 1
+FLAG_CONNECTED = 2
+
+BUTTON_FIRE = 1
+
+COUNT = struct.Struct("!H")
+BULLET_COUNT = struct.Struct("!I")
+TICK = struct.Struct("!I")
+DELTA_HEADER = struct.Struct("!II")
+TIMESTAMP = struct.Struct("!d")
+COLOR = struct.Struct("!3B")
+# color, x, y, angle, hp, kills, flags
+PLAYER_RECORD = struct.Struct("!3B3fhHB")
+# x, y, vx, vy, owner index, color, tick the position was taken at
+BULLET_RECORD = struct.Struct("!4fH3BI")
+# sequence, movement key mask, aim angle, buttons
+INPUT_RECORD = struct.Struct("!IBfB")
+# last input sequence processed, resulting x, y
+INPUT_ACK = struct.Struct("!Iff")
+
+# Order of the fields in a player record; bit i of a delta field mask refers to PLAYER_FIELDS[i]
+PLAYER_FIELDS = ("name", "color", "x", "y", "angle", "hp", "kills", "flags")
+_FIELD_STRUCTS = (None, COLOR, struct.Struct("!f"), struct.Struct("!f"), struct.Struct("!f"),
+                  struct.Struct("!h"), struct.Struct("!H"), struct.Struct("!B"))
+
+class ProtocolError(Exception):
+    """Raised when a peer sends data that does not follow the wire format"""
+
+def _pack_str(value):
+    data = str(value).encode()[:255]
+    return bytes((len(data),)) + data
+
+def _unpack_str(buf, offset):
+    length = buf[offset]
+    end = offset + 1 + length
+    return bytes(buf[offset + 1:end]).decode(), end
+
+def encode_frame(msg_type, payload):
+    """Prefix a payload with its frame header"""
+    return FRAME_HEADER.pack(len(payload), msg_type) + payload
+
+def player_record(pdata):
+    """Flatten a player dict into a tuple ordered like PLAYER_FIELDS"""
+    flags = (FLAG_ALIVE if pdata.get("alive", True) else 0) | \
+            (FLAG_CONNECTED if pdata.get("connected", True) else 0)
+    return (pdata.get("name", "Player"), tuple(pdata["color"]), pdata["x"], pdata["y"],
+            pdata.get("angle", 0), int(pdata.get("hp", 100)), pdata.get("kills", 0), flags)
+
+def _record_to_dict(fields):
+    """Turn decoded (field, value) pairs back into player dict entries"""
+    pdata = {}
+    for field, value in fields:
+        if field == "flags":
+            pdata["alive"] = bool(value & FLAG_ALIVE)
+            pdata["connected"] = bool(value & FLAG_CONNECTED)
+        else:
+            pdata[field] = value
+    return pdata
+
+def _encode_players(players):
+    """Encode {pid: record} where records come from player_record"""
+    parts = [COUNT.pack(len(players))]
+    for pid, (name, color, x, y, angle, hp, kills, flags) in players.items():
+        parts.append(_pack_str(pid))
+        parts.append(_pack_str(name))
+        parts.append(PLAYER_RECORD.pack(*color, x, y, angle, hp, kills, flags))
+    return b"".join(parts)
+
+def _decode_players(buf, offset):
+    (count,), offset = COUNT.unpack_from(buf, offset), offset + COUNT.size
+    players = {}
+    for _ in range(count):
+        pid, offset = _unpack_str(buf, offset)
+        name, offset = _unpack_str(buf, offset)
+        r, g, b, x, y, angle, hp, kills, flags = PLAYER_RECORD.unpack_from(buf, offset)
+        offset += PLAYER_RECORD.size
+        players[pid] = _record_to_dict(zip(PLAYER_FIELDS, (name, (r, g, b), x, y, angle,
+                                                           hp, kills, flags)))
+    return players, offset
+
+def _encode_player_changes(changes):
+    """Encode {pid: (mask, record)} keeping only the masked fields"""
+    parts = [COUNT.pack(len(changes))]
+    for pid, (mask, record) in changes.items():
+        parts.append(_pack_str(pid))
+        parts.append(bytes((mask,)))
+        for i, packer in enumerate(_FIELD_STRUCTS):
+            if mask & (1 << i):
+                value = record[i]
+                if packer is None:
+                    parts.append(_pack_str(value))
+                elif packer is COLOR:
+                    parts.append(COLOR.pack(*value))
+                else:
+                    parts.append(packer.pack(value))
+    return b"".join(parts)
+
+def _decode_player_changes(buf, offset):
+    (count,), offset = COUNT.unpack_from(buf, offset), offset + COUNT.size
+    changes = {}
+    for _ in range(count):
+        pid, offset = _unpack_str(buf, offset)
+        mask = buf[offset]
+        offset += 1
+        fields = []
+        for i, packer in enumerate(_FIELD_STRUCTS):
+            if mask & (1 << i):
+                if packer is None:
+                    value, offset = _unpack_str(buf, offset)
+                else:
+                    value = packer.unpack_from(buf, offset)
+                    value = value if packer is COLOR else value[0]
+                    offset += packer.size
+                fields.append((PLAYER_FIELDS[i], value))
+        changes[pid] = _record_to_dict(fields)
+    return changes, offset
+
+def _encode_ids(ids):
+    ids = list(ids)
+    return BULLET_COUNT.pack(len(ids)) + b"".join(_pack_str(i) for i in ids)
+
+def _decode_ids(buf, offset):
+    (count,), offset = BULLET_COUNT.unpack_from(buf, offset), offset + BULLET_COUNT.size
+    ids = []
+    for _ in range(count):
+        value, offset = _unpack_str(buf, offset)
+        ids.append(value)
+    return ids, offset
+
+def _encode_colors(used_colors):
+    return COUNT.pack(len(used_colors)) + b"".join(COLOR.pack(*color) for color in used_colors)
+
+def _decode_colors(buf, offset):
+    (count,), offset = COUNT.unpack_from(buf, offset), offset + COUNT.size
+    colors = [COLOR.unpack_from(buf, offset + i * COLOR.size) for i in range(count)]
+    return colors, offset + count * COLOR.size
+
+def _encode_bullets(bullets):
+    """Encode (id, (x, y, vx, vy, owner_id, color, tick)) rows with an owner string table"""
+    owners = {}
+    records = []
+    for bullet_id, (x, y, vx, vy, owner_id, color, tick) in bullets:
+        owner = owners.get(owner_id)
+        if owner is None:
+            owner = owners[owner_id] = len(owners)
+        records.append(_pack_str(bullet_id))
+        records.append(BULLET_RECORD.pack(x, y, vx, vy, owner, *color, tick))
+
+    parts = [COUNT.pack(len(owners))]
+    parts.extend(_pack_str(owner_id) for owner_id in owners)
+    parts.append(BULLET_COUNT.pack(len(records) // 2))
+    parts.extend(records)
+    return b"".join(parts)
+
+def _decode_bullets(buf, offset):
+    (owner_count,), offset = COUNT.unpack_from(buf, offset), offset + COUNT.size
+    owners = []
+    for _ in range(owner_count):
+        owner_id, offset = _unpack_str(buf, offset)
+        owners.append(owner_id)
+
+    (count,), offset = BULLET_COUNT.unpack_from(buf, offset), offset + BULLET_COUNT.size
+    bullets = {}
+    for _ in range(count):
+        bullet_id, offset = _unpack_str(buf, offset)
+        x, y, vx, vy, owner, r, g, b, tick = BULLET_RECORD.unpack_from(buf, offset)
+        offset += BULLET_RECORD.size
+        bullets[bullet_id] = {
+            "x": x, "y": y, "vx": vx, "vy": vy,
+            "owner_id": owners[owner], "id": bullet_id, "color": (r, g, b), "tick": tick
+        }
+    return bullets, offset
+
+def _bullet_rows(bullet_dicts):
+    for b in bullet_dicts:
+        yield b["id"], (b["x"], b["y"], b["vx"], b["vy"], b["owner_id"], b["color"], 0)
+
+def encode_player_update(player_dict, player_id):
+    """Encode a client's own player state"""
+    return encode_frame(MSG_PLAYER_UPDATE, _encode_players({player_id: player_record(player_dict)}))
+
+def encode_new_bullets(bullet_dicts):
+    """Encode bullets fired by a client since its last update"""
+    return encode_frame(MSG_NEW_BULLETS, _encode_bullets(_bullet_rows(bullet_dicts)))
+
+def encode_respawn_request(player_id):
+    """Encode a respawn request"""
+    return encode_frame(MSG_RESPAWN_REQUEST, _pack_str(player_id))
+
+def encode_inputs(player_id, inputs):
+    """Encode (sequence, key mask, angle, buttons) input commands, oldest first"""
+    inputs = inputs[-255:]
+    return encode_frame(MSG_INPUT, _pack_str(player_id) + bytes((len(inputs),)) +
+                        b"".join(INPUT_RECORD.pack(*command) for command in inputs))
+
+def encode_input_ack(sequence, x, y):
+    """Encode the last input the server applied and where it left the player"""
+    return encode_frame(MSG_INPUT_ACK, INPUT_ACK.pack(sequence, x, y))
+
+def encode_ack(tick):
+    """Encode a client's acknowledgement of the last snapshot tick it applied"""
+    return encode_frame(MSG_ACK, TICK.pack(tick))
+
+def encode_ping(timestamp):
+    """Encode a latency probe carrying the sender's clock"""
+    return encode_frame(MSG_PING, TIMESTAMP.pack(timestamp))
+
+def encode_pong(timestamp):
+    """Encode the echo of a ping"""
+    return encode_frame(MSG_PONG, TIMESTAMP.pack(timestamp))
+
+def encode_hello(hello):
+    """Wrap a JSON handshake message in a frame"""
+    return encode_frame(MSG_HELLO, json.dumps(hello).encode())
+
+def encode_disconnect():
+    """Encode a notice that the sender is leaving"""
+    return encode_frame(MSG_DISCONNECT, b"")
+
+def encode_snapshot(state):
+    """Encode a full keyframe of a published state"""
+    payload = (TICK.pack(state["tick"]) + _encode_players(state["players"]) +
+               _encode_colors(state["used_colors"]) + _encode_bullets(state["bullets"].items()))
+    return encode_frame(MSG_SNAPSHOT, payload)
+
+def encode_delta(base, state):
+    """Encode the changes between a baseline state and a newer one"""
+    base_players, players = base["players"], state["players"]
+    changes = {}
+    for pid, record in players.items():
+        old = base_players.get(pid)
+        if old is None:
+            changes[pid] = ((1 << len(PLAYER_FIELDS)) - 1, record)
+        elif old != record:
+            mask = 0
+            for i, (a, b) in enumerate(zip(old, record)):
+                if a != b:
+                    mask |= 1 << i
+            changes[pid] = (mask, record)
+    removed_players = [pid for pid in base_players if pid not in players]
+
+    base_bullets, bullets = base["bullets"], state["bullets"]
+    added = [(bid, bullets[bid]) for bid in bullets.keys() - base_bullets.keys()]
+    removed = base_bullets.keys() - bullets.keys()
+
+    parts = [DELTA_HEADER.pack(state["tick"], base["tick"]),
+             _encode_player_changes(changes),
+             COUNT.pack(len(removed_players)),
+             b"".join(_pack_str(pid) for pid in removed_players)]
+    if state["used_colors"] != base["used_colors"]:
+        parts.append(b"\x01" + _encode_colors(state["used_colors"]))
+    else:
+        parts.append(b"\x00")
+    parts.append(_encode_bullets(added))
+    parts.append(_encode_ids(removed))
+    return encode_frame(MSG_DELTA, b"".join(parts))
+
+def decode_message(msg_type, payload):
+    """Decode a frame payload into the dictionary shape the game logic uses"""
+    try:
+        if msg_type == MSG_PLAYER_UPDATE:
+            players, _ = _decode_players(payload, 0)
+            return {"players": players}
+        if msg_type == MSG_NEW_BULLETS:
+            bullets, _ = _decode_bullets(payload, 0)
+            return {"new_bullets": list(bullets.values())}
+        if msg_type == MSG_RESPAWN_REQUEST:
+            player_id, _ = _unpack_str(payload, 0)
+            return {"respawn_request": player_id}
+        if msg_type == MSG_INPUT:
+            player_id, offset = _unpack_str(payload, 0)
+            count = payload[offset]
+            offset += 1
+            inputs = [INPUT_RECORD.unpack_from(payload, offset + i * INPUT_RECORD.size)
+                      for i in range(count)]
+            return {"inputs": inputs, "player_id": player_id}
+        if msg_type == MSG_INPUT_ACK:
+            sequence, x, y = INPUT_ACK.unpack_from(payload, 0)
+            return {"input_ack": sequence, "x": x, "y": y}
+        if msg_type == MSG_ACK:
+            return {"ack": TICK.unpack_from(payload, 0)[0]}
+        if msg_type == MSG_PING:
+            return {"ping": TIMESTAMP.unpack_from(payload, 0)[0]}
+        if msg_type == MSG_PONG:
+            return {"pong": TIMESTAMP.unpack_from(payload, 0)[0]}
+        if msg_type == MSG_HELLO:
+            return {"hello": parse_handshake(bytes(payload))}
+        if msg_type == MSG_DISCONNECT:
+            return {"disconnect": True}
+        if msg_type == MSG_SNAPSHOT:
+            (tick,) = TICK.unpack_from(payload, 0)
+            players, offset = _decode_players(payload, TICK.size)
+            used_colors, offset = _decode_colors(payload, offset)
+            bullets, _ = _decode_bullets(payload, offset)
+            return {"tick": tick, "keyframe": True, "players": players,
+                    "bullets": bullets, "used_colors": used_colors}
+        if msg_type == MSG_DELTA:
+            tick, baseline = DELTA_HEADER.unpack_from(payload, 0)
+            players, offset = _decode_player_changes(payload, DELTA_HEADER.size)
+            (count,), offset = COUNT.unpack_from(payload, offset), offset + COUNT.size
+            removed_players = []
+            for _ in range(count):
+                pid, offset = _unpack_str(payload, offset)
+                removed_players.append(pid)
+            msg = {"tick": tick, "baseline": baseline, "players": players,
+                   "removed_players": removed_players}
+            has_colors = payload[offset]
+            offset += 1
+            if has_colors:
+                msg["used_colors"], offset = _decode_colors(payload, offset)
+            msg["bullets"], offset = _decode_bullets(payload, offset)
+            msg["removed_bullets"], _ = _decode_ids(payload, offset)
+            return msg
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ProtocolError(f"Malformed message {msg_type}: {e}")
+    raise ProtocolError(f"Unknown message type {msg_type}")
+
+def read_handshake(reader):
+    """Block until the peer's JSON handshake line has arrived and parse it"""
+    while True:
+        line = reader.read_line(MAX_HANDSHAKE_LENGTH)
+        if line is not None:
+            return parse_handshake(line)
+        if not reader.fill():
+            raise ProtocolError("Connection closed during handshake")
+
+def parse_handshake(line):
+    """Parse a handshake line"""
+    try:
+        return json.loads(line.decode())
+    except ValueError:
+        raise ProtocolError("Malformed handshake")
+
+def client_handshake(sock, reader, room=None):
+    """Negotiate the binary protocol from the client side; returns the server's welcome"""
+    send_data(sock, client_hello(room))
+    reply = read_handshake(reader)
+    check_welcome(reply)
+    return reply
+
+def client_hello(room=None):
+    """The hello a client opens the handshake with; a lobby places it in room if one is named"""
+    hello = {"hello": PROTOCOL_NAME, "version": PROTOCOL_VERSION}
+    if room is not None:
+        hello["room"] = room
+    return hello
+
+def check_welcome(reply):
+    """Raise ProtocolError unless the server's reply accepts our protocol version"""
+    if not isinstance(reply, dict) or reply.get("version") != PROTOCOL_VERSION:
+        raise ProtocolError(reply.get("error", "Protocol version mismatch")
+                            if isinstance(reply, dict) else "Malformed handshake")
+
+def check_hello(hello):
+    """Validate a client's hello and return the reply to send back"""
+    if not isinstance(hello, dict) or hello.get("hello") != PROTOCOL_NAME or \
+            hello.get("version") != PROTOCOL_VERSION:
+        return {"error": f"Unsupported protocol, server speaks version {PROTOCOL_VERSION}"}
+    return {"version": PROTOCOL_VERSION}
+
+def server_handshake(sock, reader):
+    """Negotiate the binary protocol from the server side"""
+    reply = check_hello(read_handshake(reader))
+    send_data(sock, reply)
+    if "error" in reply:
+        raise ProtocolError("Unsupported client protocol")
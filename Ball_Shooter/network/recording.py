@@ -0,0 +1,226 @@
+import logging
+import mmap
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+from itertools import count
+import numpy as np
+from config import SIM_RATE, RECORD_KEYFRAME_INTERVAL, RECORD_QUEUE_SIZE
+from network.protocol import (FRAME_HEADER, PROTOCOL_VERSION, decode_message, encode_delta,
+                              encode_frame, encode_snapshot)
+from network.snapshots import SnapshotReceiver
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"BSREC"
+INDEX_MAGIC = b"BSIDX"
+FORMAT_VERSION = 1
+# Seconds between warnings while records are being dropped
+DROP_WARNING_INTERVAL = 5.0
+
+# magic, format version, protocol version, simulation rate, ticks per keyframe
+FILE_HEADER = struct.Struct("!5sBBHI")
+# record kind, tick, client number, payload length
+RECORD = struct.Struct("!BIII")
+# index offset, bucket of the first index entry, entries, magic
+FOOTER = struct.Struct("!QII5s")
+
+# Payloads: a snapshot or delta frame against the previous state record, a client frame as
+# received, or the id of a client that left
+KEYFRAME = 1
+DELTA = 2
+COMMAND = 3
+LEAVE = 4
+
+# state is the full state after the tick, or None if none was recorded for it; commands are
+# (client number, frame) pairs in the order the server applied them, frame None for a leave
+ReplayTick = namedtuple("ReplayTick", "tick state commands")
+
+class MatchRecorder:
+    """Appends a match to a replay file: every client message the tick applies and every
+    broadcast state, as deltas with a keyframe each keyframe_interval ticks
+
+    The tick only queues references; encoding and writing happen on a background thread.
+    When the disk falls behind and the queue fills, records are dropped; a dropped state
+    only makes the next delta larger, a dropped command is missing from the replay.
+    """
+
+    def __init__(self, path, keyframe_interval=RECORD_KEYFRAME_INTERVAL, queue_size=RECORD_QUEUE_SIZE):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.file = open(path, "wb")
+        self.file.write(FILE_HEADER.pack(MAGIC, FORMAT_VERSION, PROTOCOL_VERSION, SIM_RATE,
+                                         keyframe_interval))
+        self.pending = queue.Queue(queue_size)
+        self.dropped = 0
+        self.warned_at = float("-inf")
+        self.clients = {}
+        self.client_numbers = count(1)
+
+        # Writer thread state
+        self.previous = None
+        self.tick = None
+        self.tick_offset = FILE_HEADER.size
+        self.index = []
+        self.first_bucket = None
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def command(self, tick, client, msg, frame):
+        """Record a client message applied at tick; frame is its (type, payload bytes)"""
+        number = self.clients.get(client)
+        if number is None:
+            number = self.clients[client] = next(self.client_numbers)
+        if frame is None:
+            if "leave" in msg:
+                del self.clients[client]
+                self._put((LEAVE, tick, number, str(msg["leave"] or "").encode()))
+            return
+        self._put((COMMAND, tick, number, frame))
+
+    def state(self, state):
+        """Record a published state; it is read-only, so encoding it later is safe"""
+        self._put((KEYFRAME, state["tick"], 0, state))
+
+    def _put(self, item):
+        try:
+            self.pending.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            now = time.monotonic()
+            if now - self.warned_at >= DROP_WARNING_INTERVAL:
+                self.warned_at = now
+                logger.warning("Recording to %s is behind the disk; %d records dropped so far", self.path, self.dropped)
+
+    def close(self):
+        """Write what is queued, then the keyframe index"""
+        self.pending.put(None)
+        self.thread.join()
+
+    def _write_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            kind, tick, client, data = item
+            if tick != self.tick:
+                self.tick, self.tick_offset = tick, self.file.tell()
+
+            if kind == KEYFRAME:
+                state = data
+                bucket = tick // self.keyframe_interval
+                if self.previous is None or bucket >= self.first_bucket + len(self.index):
+                    self._index(bucket)
+                    data = encode_snapshot(state)
+                else:
+                    kind, data = DELTA, encode_delta(self.previous, state)
+                self.previous = state
+            elif kind == COMMAND:
+                data = encode_frame(*data)
+
+            self.file.write(RECORD.pack(kind, tick, client, len(data)))
+            self.file.write(data)
+
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=">u8").tobytes())
+        self.file.write(FOOTER.pack(index_offset, self.first_bucket or 0, len(self.index), INDEX_MAGIC))
+        self.file.close()
+
+    def _index(self, bucket):
+        """Point bucket at the tick now being written; buckets with no state keep the previous keyframe"""
+        if self.first_bucket is None:
+            self.first_bucket = bucket
+        while self.index and len(self.index) < bucket - self.first_bucket:
+            self.index.append(self.index[-1])
+        self.index.append(self.tick_offset)
+
+class ReplayReader:
+    """Memory-mapped replay file; seeks to a tick in constant time through the keyframe
+    index and streams ticks lazily from there"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+        magic, version, protocol, self.sim_rate, self.keyframe_interval = FILE_HEADER.unpack_from(self.view)
+        if magic != MAGIC or version != FORMAT_VERSION or protocol != PROTOCOL_VERSION:
+            raise ValueError(f"{path} is not a replay this version can read")
+
+        footer = len(self.view) - FOOTER.size
+        if footer >= FILE_HEADER.size and bytes(self.view[footer:]).endswith(INDEX_MAGIC):
+            self.end, self.first_bucket, entries, _ = FOOTER.unpack_from(self.view, footer)
+            self.index = np.frombuffer(self.view, dtype=">u8", count=entries, offset=self.end)
+        else:
+            # The recording was cut short; rebuild the index from the records
+            self.end = len(self.view)
+            self._scan()
+
+    def _scan(self):
+        index = []
+        self.first_bucket = 0
+        tick, tick_offset = None, FILE_HEADER.size
+        for offset, kind, record_tick, _, _ in self._records(FILE_HEADER.size):
+            if record_tick != tick:
+                tick, tick_offset = record_tick, offset
+            if kind == KEYFRAME:
+                bucket = record_tick // self.keyframe_interval
+                if not index:
+                    self.first_bucket = bucket
+                while index and len(index) < bucket - self.first_bucket:
+                    index.append(index[-1])
+                index.append(tick_offset)
+        self.index = np.array(index, dtype=">u8")
+
+    def _records(self, offset):
+        """Yield (offset, kind, tick, client, payload view) from offset to the end of the records"""
+        view = self.view
+        while offset + RECORD.size <= self.end:
+            kind, tick, client, length = RECORD.unpack_from(view, offset)
+            start = offset + RECORD.size
+            if start + length > self.end:
+                return
+            yield offset, kind, tick, client, view[start:start + length]
+            offset = start + length
+
+    def seek(self, tick):
+        """Offset of the keyframe at or before tick (the first one if tick precedes it)"""
+        if not len(self.index):
+            return self.end
+        bucket = min(max(tick // self.keyframe_interval - self.first_bucket, 0), len(self.index) - 1)
+        return int(self.index[bucket])
+
+    def ticks(self, start=None, end=None):
+        """Yield a ReplayTick for each recorded tick from start (or the beginning) to end"""
+        receiver = SnapshotReceiver()
+        offset = self.seek(start) if start is not None else FILE_HEADER.size
+        current = None
+        state = None
+        commands = []
+        for _, kind, tick, client, data in self._records(offset):
+            if tick != current:
+                if current is not None and (start is None or current >= start):
+                    yield ReplayTick(current, state, commands)
+                if end is not None and tick > end:
+                    return
+                current, state, commands = tick, None, []
+
+            if kind == KEYFRAME or kind == DELTA:
+                _, msg_type = FRAME_HEADER.unpack_from(data)
+                if receiver.apply(decode_message(msg_type, data[FRAME_HEADER.size:])) is not None:
+                    state = receiver.applied
+            elif kind == COMMAND:
+                commands.append((client, bytes(data)))
+            elif kind == LEAVE:
+                commands.append((client, None))
+
+        if current is not None and (start is None or current >= start):
+            yield ReplayTick(current, state, commands)
+
+    def close(self):
+        self.index = None
+        self.view.release()
+        self.map.close()
+        self.file.close()
@@ -0,0 +1,73 @@
+import math
+import time
+from config import SIM_RATE, BROADCAST_RATE, OVERRUN_POLICY, MAX_CATCHUP_TICKS
+
+class TickScheduler:
+    """Fixed-timestep deadlines for the simulation and the (slower) broadcast
+
+    Deadlines sit on a fixed grid measured from start(), so slow ticks never
+    push later ones back. When the loop falls behind, the "catchup" policy
+    runs up to max_catchup ticks back to back and "skip" runs a single tick;
+    either way the ticks that cannot be run are skipped and counted.
+    """
+
+    def __init__(self, sim_rate=SIM_RATE, broadcast_rate=BROADCAST_RATE,
+                 policy=OVERRUN_POLICY, max_catchup=MAX_CATCHUP_TICKS, clock=time.monotonic):
+        if policy not in ("catchup", "skip"):
+            raise ValueError(f"Unknown overrun policy: {policy}")
+        self.interval = 1 / sim_rate
+        self.broadcast_every = max(1, round(sim_rate / broadcast_rate))
+        self.policy = policy
+        self.max_catchup = max(1, max_catchup)
+        self.clock = clock
+        self.next_deadline = None
+
+        self.ticks_run = 0
+        self.missed_deadlines = 0
+        self.skipped_ticks = 0
+        self.max_lateness = 0.0
+
+    def start(self):
+        """Place the first deadline one interval from now"""
+        self.next_deadline = self.clock() + self.interval
+
+    def time_until_next(self):
+        """Seconds until the next tick is due"""
+        return max(0.0, self.next_deadline - self.clock())
+
+    def sleep(self):
+        """Block until the next tick is due"""
+        delay = self.time_until_next()
+        if delay > 0:
+            time.sleep(delay)
+
+    def due(self):
+        """Return how many ticks to simulate now and advance the deadline grid"""
+        now = self.clock()
+        if now < self.next_deadline:
+            return 0
+
+        lateness = now - self.next_deadline
+        pending = math.floor(lateness / self.interval) + 1
+        self.max_lateness = max(self.max_lateness, lateness)
+        if pending > 1:
+            self.missed_deadlines += pending - 1
+
+        run = min(pending, self.max_catchup) if self.policy == "catchup" else 1
+        self.skipped_ticks += pending - run
+        self.ticks_run += run
+        self.next_deadline += pending * self.interval
+        return run
+
+    def broadcast_due(self, tick, ticks_run):
+        """Whether the last ticks_run ticks, ending at tick, crossed a broadcast boundary"""
+        return ticks_run > 0 and tick // self.broadcast_every != (tick - ticks_run) // self.broadcast_every
+
+    def stats(self):
+        """Counters describing how well deadlines are being met"""
+        return {
+            "ticks_run": self.ticks_run,
+            "missed_deadlines": self.missed_deadlines,
+            "skipped_ticks": self.skipped_ticks,
+            "max_lateness": self.max_lateness
+        }
@@ -1,28 +1,87 @@
 import socket
-import json
 import threading
+import logging
 import time
-import random
+from collections import deque
 from config import *
-from game.entities import Bullet, Player
+from game.simulation import Simulation
+from network.outbound import SendQueue
+from network.protocol import ProtocolError, decode_message, encode_input_ack, encode_pong, server_handshake
+from network.recording import MatchRecorder
+from network.scheduler import TickScheduler
+from network.snapshots import SnapshotHistory, build_state, view_state
+from network.stats import ServerStats, StatsServer
+from network.stream import StreamReader
+from utils.helpers import set_low_latency
+
+logger = logging.getLogger(__name__)
 
 class GameServer:
-    def __init__(self):
+    """Transport around a Simulation: feeds it the messages clients send and sends them
+    the states it produces"""
+    
+    def __init__(self, seed=None):
         self.server_socket = None
         self.clients = []
-        self.client_players = {}
         self.running = False
-        self.game_state = {"players": {}, "bullets": {}, "used_colors": []}
-        self.used_colors = set()
+        self.stats = ServerStats()
+        self.simulation = Simulation(seed, phase=self.stats.phase)
+        self.tick = 0
+        # Filled by client handler threads, drained by the tick; deque appends and pops are atomic
+        self.commands = deque()
+        self.published = None
+        self.scheduler = TickScheduler()
+        self.history = SnapshotHistory()
+        self.client_acks = {}
+        self.client_ids = {}
+        self.client_players = {}
+        self.client_histories = {}
+        self.client_inputs = {}
+        self.outbound = {}
+        self.stats_server = None
+        self.recorder = None
     
-    def start(self):
-        """Start the game server"""
+    def _open_listener(self):
+        """Create the listening socket"""
         self.server_socket = socket.socket()
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
+        self.server_socket.bind(("0.0.0.0", PORT))
+        self.server_socket.listen(5)
+    
+    def _start_stats(self):
+        """Serve stats on the local endpoint if one is configured"""
+        if STATS_PORT:
+            self.stats_server = StatsServer(self.get_stats, STATS_PORT)
+            self.stats_server.start()
+            print(f"Stats available at http://{STATS_HOST}:{STATS_PORT}/stats")
+    
+    def _start_recording(self):
+        """Record the match if a recording path is configured"""
+        if RECORD_PATH:
+            path = time.strftime(RECORD_PATH)
+            self.recorder = MatchRecorder(path)
+            print(f"Recording match to {path}")
+    
+    def get_stats(self):
+        """Machine-readable snapshot of server health"""
+        stats = self.stats.to_dict()
+        state = self.published
+        stats.update({
+            "tick": self.tick,
+            "clients_connected": len(self.clients),
+            "players": len(state["players"]) if state else 0,
+            "bullets": len(state["bullets"]) if state else 0,
+            "commands_pending": len(self.commands),
+            "scheduler": self.scheduler.stats()
+        })
+        return stats
+    
+    def start(self):
+        """Start the game server"""
         try:
-            self.server_socket.bind(("0.0.0.0", PORT))
-            self.server_socket.listen(5)
+            self._open_listener()
+            self._start_stats()
+            self._start_recording()
             self.running = True
             print(f"Server started on port {PORT}")
             
@@ -37,6 +96,11 @@ class GameServer:
     def stop(self):
         """Stop the game server"""
         self.running = False
+        if self.stats_server:
+            self.stats_server.stop()
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
         if self.server_socket:
             try:
                 self.server_socket.close()
@@ -56,98 +120,132 @@ class GameServer:
             try:
                 self.server_socket.settimeout(1.0)
                 client_socket, addr = self.server_socket.accept()
-                self.clients.append(client_socket)
                 print(f"Client connected from {addr}")
+                set_low_latency(client_socket)
+                self.stats.register(client_socket, f"{addr[0]}:{addr[1]}")
                 threading.Thread(target=self._handle_client, args=(client_socket,), daemon=True).start()
             except socket.timeout:
                 continue
             except:
                 break
     
-    def _handle_client(self, client_socket):
+    def adopt(self, client_socket, addr):
+        """Serve a client whose handshake was already answered elsewhere, e.g. by a lobby"""
+        set_low_latency(client_socket)
+        self.stats.register(client_socket, f"{addr[0]}:{addr[1]}")
+        threading.Thread(target=self._handle_client, args=(client_socket, False), daemon=True).start()
+    
+    def _handle_client(self, client_socket, handshake=True):
         """Handle individual client communication"""
-        client_id = None
+        reader = StreamReader(client_socket)
+        
+        if handshake:
+            try:
+                server_handshake(client_socket, reader)
+            except (ProtocolError, OSError) as e:
+                print(f"Handshake failed: {e}")
+                self._cleanup_client(client_socket)
+                return
         
+        queue = self.outbound[client_socket] = SendQueue()
+        threading.Thread(target=self._write_client, args=(client_socket, queue), daemon=True).start()
+        self.clients.append(client_socket)
+        
+        traffic = self.stats.client(client_socket)
         while self.running:
             try:
-                data = client_socket.recv(4096).decode()
-                if not data:
+                received = reader.fill()
+                if not received:
                     break
+                traffic.bytes_in += received
                 
-                for msg_str in data.split('\n'):
-                    if not msg_str.strip():
-                        continue
-                    
-                    try:
-                        msg = json.loads(msg_str)
-                        self._process_client_message(msg, client_socket)
-                        
-                        if "players" in msg:
-                            for pid in msg["players"]:
-                                self.client_players[pid] = client_socket
-                                client_id = pid
-                    except json.JSONDecodeError:
-                        continue
+                for msg_type, payload in reader.frames():
+                    traffic.messages_in += 1
+                    self._handle_frame(client_socket, msg_type, payload)
                         
+            except ProtocolError:
+                self.stats.bad_frames += 1
+                break
             except:
                 break
         
-        self._cleanup_client(client_socket, client_id)
+        self._cleanup_client(client_socket)
+    
+    def _handle_frame(self, client_socket, msg_type, payload):
+        """Decode one client frame and apply it, or queue it for the tick"""
+        msg = decode_message(msg_type, payload)
+        if "ack" in msg or "ping" in msg:
+            # These only touch per-connection state, so they need not wait for the tick
+            self._process_client_message(msg, client_socket)
+        else:
+            self._queue_command(client_socket, msg, (msg_type, payload))
+    
+    def _queue_command(self, client_socket, msg, frame=None):
+        """Hand a decoded message, and the (type, payload) frame it came from, to the tick"""
+        if self.recorder and frame is not None:
+            # The payload is a view into the reader's buffer, which is reused
+            frame = (frame[0], bytes(frame[1]))
+        self.commands.append((client_socket, msg, frame))
     
     def _process_client_message(self, msg, client_socket):
         """Process message from client"""
-        # Handle respawn requests
-        if "respawn_request" in msg:
-            player_id = msg["respawn_request"]
-            if player_id in self.game_state["players"]:
-                player_data = self.game_state["players"][player_id]
-                if not player_data.get("alive", True):
-                    # Server-side respawn
-                    player_data["hp"] = 100
-                    player_data["alive"] = True
-                    player_data["x"] = random.randint(PLAYER_RADIUS * 2, MAP_WIDTH - PLAYER_RADIUS * 2)
-                    player_data["y"] = random.randint(PLAYER_RADIUS * 2, MAP_HEIGHT - PLAYER_RADIUS * 2)
-                    print(f"Player {player_id} respawned at ({player_data['x']}, {player_data['y']})")
+        if "ack" in msg:
+            self.client_acks[client_socket] = msg["ack"]
             return
         
-        if "players" in msg:
-            for pid, pdata in msg["players"].items():
-                if pid in self.game_state["players"]:
-                    # Preserve server-authoritative values
-                    server_player = self.game_state["players"][pid]
-                    
-                    # Only update position and angle if player is alive
-                    if server_player.get("alive", True):
-                        server_player["x"] = pdata["x"]
-                        server_player["y"] = pdata["y"]
-                        server_player["angle"] = pdata["angle"]
-                    
-                    # Always preserve server's HP and alive status
-                    # Only update other non-critical fields
-                    server_player["connected"] = pdata.get("connected", True)
-                    server_player["name"] = pdata.get("name", "Player")
-                else:
-                    # New player joining
-                    self.game_state["players"][pid] = pdata
-                    self.used_colors.add(tuple(pdata["color"]))
-            
-            self.game_state["used_colors"] = list(self.used_colors)
+        if "ping" in msg:
+            self._send(client_socket, encode_pong(msg["ping"]), droppable=False)
+            return
         
-        if "new_bullets" in msg:
-            for bullet_data in msg["new_bullets"]:
-                bullet = Bullet.from_dict(bullet_data)
-                self.game_state["bullets"][bullet.id] = bullet.to_dict()
+        # Clients may only speak for the player their connection joined with
+        bound = self.client_ids.get(client_socket)
+        if "leave" in msg:
+            self._remove_client_state(client_socket)
+            self.simulation.apply({"leave": bound})
+            return
+        
+        if "inputs" in msg:
+            if msg["player_id"] != bound:
+                raise ValueError(f"Inputs for player {msg['player_id']} from another connection")
+            self.client_inputs[client_socket] = bound
+        
+        for pid in msg.get("players", ()):
+            if bound is not None and pid != bound:
+                raise ValueError(f"Update for player {pid} from a connection bound to {bound}")
+            owner = self.client_players.setdefault(pid, client_socket)
+            if owner != client_socket:
+                raise ValueError(f"Update for player {pid} from another connection")
+            bound = self.client_ids[client_socket] = pid
+        
+        if "respawn_request" in msg and msg["respawn_request"] != bound:
+            raise ValueError(f"Respawn request for player {msg['respawn_request']} from another connection")
+        for bullet_data in msg.get("new_bullets", ()):
+            if bullet_data["owner_id"] != bound:
+                raise ValueError(f"Bullet for player {bullet_data['owner_id']} from another connection")
+        
+        self.simulation.apply(msg)
     
-    def _cleanup_client(self, client_socket, client_id):
+    def _remove_client_state(self, client_socket):
+        """Forget a departed client's per-connection game state; runs on the tick"""
+        pid = self.client_ids.pop(client_socket, None)
+        if pid is not None and self.client_players.get(pid) == client_socket:
+            del self.client_players[pid]
+        self.client_histories.pop(client_socket, None)
+        self.client_inputs.pop(client_socket, None)
+    
+    def _cleanup_client(self, client_socket):
         """Clean up disconnected client"""
-        if client_id and client_id in self.game_state["players"]:
-            del self.game_state["players"][client_id]
-        
-        if client_id in self.client_players:
-            del self.client_players[client_id]
+        # Queued behind the client's last commands so none of them can recreate its state;
+        # the tick resolves which player leaves from the connection
+        self._queue_command(client_socket, {"leave": None})
         
         if client_socket in self.clients:
             self.clients.remove(client_socket)
+        self.client_acks.pop(client_socket, None)
+        queue = self.outbound.pop(client_socket, None)
+        if queue is not None:
+            queue.close()
+        self.stats.remove_client(client_socket)
         
         try:
             client_socket.close()
@@ -156,71 +254,134 @@ class GameServer:
     
     def _game_loop(self):
         """Main game simulation loop"""
+        self.scheduler.start()
         while self.running:
-            self._update_bullets()
-            self._check_collisions()
-            self._broadcast_game_state()
-            time.sleep(1/60) 
-    
-    def _update_bullets(self):
-        """Update bullet positions and remove out-of-bounds bullets"""
-        to_remove = []
-        
-        for bullet_id, bullet_data in list(self.game_state["bullets"].items()):
-            bullet = Bullet.from_dict(bullet_data)
-            bullet.update()
-            
-            if bullet.out_of_bounds():
-                to_remove.append(bullet_id)
-            else:
-                self.game_state["bullets"][bullet_id] = bullet.to_dict()
-        
-        for bullet_id in to_remove:
-            self.game_state["bullets"].pop(bullet_id, None)
+            self._run_due_ticks()
+            self.scheduler.sleep()
     
-    def _check_collisions(self):
-        """Check bullet-player collisions"""
-        bullets_to_remove = []
-        
-        for bullet_id, bullet_data in list(self.game_state["bullets"].items()):
-            bullet = Bullet.from_dict(bullet_data)
-            
-            for player_id, player_data in self.game_state["players"].items():
-                if bullet.owner_id == player_id or not player_data.get("alive", True):
-                    continue
-                
-                temp_player = Player(player_id, player_data["x"], player_data["y"], 
-                                   player_data["color"])
-                temp_player.update_from_dict(player_data)
-                
-                if bullet.distance_to(temp_player) <= PLAYER_RADIUS + BULLET_RADIUS:
-                    self.game_state["players"][player_id]["hp"] -= BULLET_DAMAGE
-                    print(f"Player {player_id} hit! HP: {self.game_state['players'][player_id]['hp']}")
-                    
-                    if self.game_state["players"][player_id]["hp"] <= 0:
-                        self.game_state["players"][player_id]["hp"] = 0
-                        self.game_state["players"][player_id]["alive"] = False
-                        print(f"Player {player_id} died!")
-                        
-                        if bullet.owner_id in self.game_state["players"]:
-                            self.game_state["players"][bullet.owner_id]["kills"] += 1
-                            print(f"Player {bullet.owner_id} got a kill!")
-                    
-                    bullets_to_remove.append(bullet_id)
-                    break
-        
-        for bullet_id in bullets_to_remove:
-            self.game_state["bullets"].pop(bullet_id, None)
+    def _run_due_ticks(self):
+        """Simulate every tick that is due and broadcast if a snapshot boundary was crossed"""
+        ticks = self.scheduler.due()
+        if not ticks:
+            return
+        with self.stats.phase("tick"):
+            for _ in range(ticks):
+                self._simulate()
+            if self.scheduler.broadcast_due(self.tick, ticks):
+                self._broadcast_game_state()
+    
+    def _drain_commands(self):
+        """Apply the messages handlers queued before this tick, in arrival order"""
+        for _ in range(len(self.commands)):
+            client_socket, msg, frame = self.commands.popleft()
+            if self.recorder:
+                self.recorder.command(self.tick + 1, client_socket, msg, frame)
+            try:
+                self._process_client_message(msg, client_socket)
+            except (KeyError, TypeError, ValueError) as e:
+                self.stats.bad_frames += 1
+                logger.warning("Discarded bad client message: %s", e)
+    
+    def _simulate(self):
+        """Advance the simulation one tick"""
+        self._drain_commands()
+        self.simulation.step()
+        self.tick = self.simulation.tick
     
     def _broadcast_game_state(self):
-        """Send game state to all connected clients"""
+        """Send each client the changes since the last tick it acknowledged"""
+        start = time.perf_counter()
+        simulation = self.simulation
+        bullets = simulation.bullets
+        state = build_state(self.tick, simulation.players, bullets, simulation.used_colors)
+        self.history.record(state)
+        self.published = state
+        if self.recorder:
+            self.recorder.state(state)
+        self._send_state(state, bullets, start)
+    
+    def _send_state(self, state, bullets, start):
+        """Encode a published state for every client, against its view and acked baseline"""
         if not self.clients:
+            self.stats.phases["serialize"].record(time.perf_counter() - start)
             return
         
-        message = json.dumps(self.game_state) + "\n"
-        
+        shared = {}
+        serialize_time = time.perf_counter() - start
+        send_time = 0.0
         for client in self.clients[:]:
+            start = time.perf_counter()
+            center = self._view_center(client, state)
+            if AOI_RADIUS and center is not None:
+                history = self.client_histories.setdefault(client, SnapshotHistory())
+                view = view_state(state, bullets, center, AOI_RADIUS)
+                history.record(view)
+                message = history.encode_for(view, self.client_acks.get(client), {})
+            else:
+                message = self.history.encode_for(state, self.client_acks.get(client), shared)
+            
+            ack = self._input_ack(client, state)
+            if ack is not None:
+                message = encode_input_ack(*ack) + message
+            encoded = time.perf_counter()
+            
+            self._send(client, message)
+            serialize_time += encoded - start
+            send_time += time.perf_counter() - encoded
+        
+        self.stats.phases["serialize"].record(serialize_time)
+        self.stats.phases["send"].record(send_time)
+    
+    def _view_center(self, client, state):
+        """Where a client's area of interest is centered, if it has a player yet"""
+        pdata = self.simulation.players.get(self.client_ids.get(client))
+        return (pdata["x"], pdata["y"]) if pdata is not None else None
+    
+    def _input_ack(self, client, state):
+        """(last applied input, x, y) for an input-driven client, else None"""
+        pid = self.client_inputs.get(client)
+        pdata = self.simulation.players.get(pid)
+        if pdata is None or pid not in self.simulation.input_seqs:
+            return None
+        return self.simulation.input_seqs[pid], pdata["x"], pdata["y"]
+    
+    def _send(self, client, message, droppable=True):
+        """Queue an encoded message for one client without blocking"""
+        queue = self.outbound.get(client)
+        if queue is None:
+            return
+        with queue.ready:
+            dropped = queue.put(message, droppable)
+            queue.ready.notify()
+        if dropped:
+            self.stats.drop(client, dropped)
+        if queue.stalled(SLOW_CLIENT_TIMEOUT):
+            self._drop_slow_client(client)
+    
+    def _write_client(self, client_socket, queue):
+        """Drain a client's send queue on its own thread so a slow link never holds up a tick"""
+        traffic = self.stats.client(client_socket)
+        while True:
+            with queue.ready:
+                while not queue and not queue.closed:
+                    queue.ready.wait()
+                if queue.closed:
+                    return
+                message = queue.pop()
             try:
-                client.sendall(message.encode())
+                client_socket.sendall(message)
             except:
-                self.clients.remove(client)
\ No newline at end of file
+                # The reader thread sees the socket fail and cleans up
+                return
+            traffic.bytes_out += len(message)
+            traffic.messages_out += 1
+    
+    def _drop_slow_client(self, client_socket):
+        """Stop sending to a client; its reader thread notices and cleans up"""
+        if client_socket in self.clients:
+            print("Dropping client: too far behind")
+            self.clients.remove(client_socket)
+        try:
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except:
+            pass
@@ -0,0 +1,252 @@
+import struct
+import threading
+from collections.abc import Mapping
+from multiprocessing import shared_memory
+import numpy as np
+from config import SHM_MAX_PLAYERS, SHM_MAX_BULLETS, SHM_SNAPSHOT_SLOTS, SHM_QUEUE_SIZE
+from network.protocol import player_record
+
+# Longer names are cut to fit the fixed-size records; SimulationServer rejects longer ids,
+# which would no longer match the ids the relays know clients by
+ID_BYTES = 32
+NAME_BYTES = 32
+BULLET_ID_BYTES = 48
+MAX_COLORS = 64
+
+PLAYER_DTYPE = np.dtype([
+    ("id", f"S{ID_BYTES}"), ("name", f"S{NAME_BYTES}"), ("r", "u1"), ("g", "u1"), ("b", "u1"),
+    ("x", "f4"), ("y", "f4"), ("angle", "f4"), ("hp", "i2"), ("kills", "u2"), ("flags", "u1"),
+    ("input_seq", "u4")
+])
+# Current position for area-of-interest tests, then the spawn record snapshots carry
+BULLET_DTYPE = np.dtype([
+    ("id", f"S{BULLET_ID_BYTES}"), ("x", "f8"), ("y", "f8"), ("sx", "f4"), ("sy", "f4"),
+    ("vx", "f4"), ("vy", "f4"), ("owner", f"S{ID_BYTES}"), ("r", "u1"), ("g", "u1"), ("b", "u1"),
+    ("tick", "u4")
+])
+CONTROL_DTYPE = np.dtype([("latest", "u8"), ("slots", "u4"), ("max_players", "u4"), ("max_bullets", "u4")])
+SLOTS_OFFSET = 64
+
+def _slot_dtype(max_players, max_bullets):
+    return np.dtype([
+        ("seq", "u8"), ("tick", "u4"), ("players", "u4"), ("bullets", "u4"), ("colors", "u4"),
+        ("player_rows", PLAYER_DTYPE, (max_players,)),
+        ("bullet_rows", BULLET_DTYPE, (max_bullets,)),
+        ("color_rows", "u1", (MAX_COLORS, 3))
+    ])
+
+class PublishedBullets(Mapping):
+    """Bullet rows read back from a snapshot slot: the position columns view_state tests
+    and, as a mapping, the spawn records of build_state, decoded on first use"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.x = rows["x"]
+        self.y = rows["y"]
+        self.decoded = None
+
+    def records(self, mask=slice(None)):
+        """Map the ids of the selected rows to their spawn records"""
+        return {bullet_id.decode(): (sx, sy, vx, vy, owner.decode(), (r, g, b), tick)
+                for bullet_id, _, _, sx, sy, vx, vy, owner, r, g, b, tick in self.rows[mask].tolist()}
+
+    def _all(self):
+        if self.decoded is None:
+            self.decoded = self.records()
+        return self.decoded
+
+    def __getitem__(self, bullet_id):
+        return self._all()[bullet_id]
+
+    def __iter__(self):
+        return iter(self._all())
+
+    def __len__(self):
+        return len(self.rows)
+
+    def keys(self):
+        return self._all().keys()
+
+    def items(self):
+        return self._all().items()
+
+class SnapshotRing:
+    """Ring of fixed-layout snapshot slots in shared memory, written by the simulation
+    process and read by any number of I/O processes
+
+    Each slot carries a sequence number that is zeroed while the slot is written, so a
+    reader that sees the same number before and after copying a slot got a whole snapshot.
+    """
+
+    def __init__(self, name=None, slots=SHM_SNAPSHOT_SLOTS, max_players=SHM_MAX_PLAYERS,
+                 max_bullets=SHM_MAX_BULLETS):
+        if name is None:
+            size = SLOTS_OFFSET + slots * _slot_dtype(max_players, max_bullets).itemsize
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+            self.control = np.ndarray((1,), dtype=CONTROL_DTYPE, buffer=self.shm.buf)
+            self.control[0] = (0, slots, max_players, max_bullets)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            self.control = np.ndarray((1,), dtype=CONTROL_DTYPE, buffer=self.shm.buf)
+
+        _, slots, max_players, max_bullets = self.control[0].tolist()
+        self.max_players = max_players
+        self.max_bullets = max_bullets
+        self.slots = np.ndarray((slots,), dtype=_slot_dtype(max_players, max_bullets),
+                                buffer=self.shm.buf, offset=SLOTS_OFFSET)
+        self.written = int(self.control["latest"][0])
+        self.truncated = False
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def publish(self, tick, players, bullets, used_colors, input_seqs):
+        """Write the state at the end of a tick into the next slot"""
+        seq = self.written + 1
+        i = seq % len(self.slots)
+        slots = self.slots
+        slots["seq"][i] = 0
+
+        rows = [(pid.encode(), name.encode(), *color, x, y, angle, hp, kills, flags, input_seqs.get(pid, 0))
+                for pid, (name, color, x, y, angle, hp, kills, flags)
+                in ((pid, player_record(pdata)) for pid, pdata in players.items())]
+        n = len(bullets)
+        self.truncated = len(rows) > self.max_players or n > self.max_bullets
+        rows = rows[:self.max_players]
+        n = min(n, self.max_bullets)
+        slots["player_rows"][i, :len(rows)] = np.array(rows, dtype=PLAYER_DTYPE)
+        slots["players"][i] = len(rows)
+
+        spawns = bullets.spawns[:n].tolist()
+        slots["bullet_rows"][i, :n] = np.array(
+            [(bullet_id.encode(), x, y, sx, sy, vx, vy, owner.encode(), *color, spawn_tick)
+             for bullet_id, x, y, (sx, sy, vx, vy, owner, color, spawn_tick)
+             in zip(bullets.ids[:n].tolist(), bullets.x[:n].tolist(), bullets.y[:n].tolist(), spawns)],
+            dtype=BULLET_DTYPE)
+        slots["bullets"][i] = n
+
+        colors = list(used_colors)[:MAX_COLORS]
+        if colors:
+            slots["color_rows"][i, :len(colors)] = colors
+        slots["colors"][i] = len(colors)
+
+        slots["tick"][i] = tick
+        slots["seq"][i] = seq
+        self.control["latest"][0] = seq
+        self.written = seq
+
+    def read(self, after=0):
+        """(seq, state, bullets, input_seqs) for the newest snapshot if it is newer than after,
+        else None; state is shaped like build_state's and bullets like a PublishedBullets"""
+        seq = int(self.control["latest"][0])
+        if seq <= after:
+            return None
+        i = seq % len(self.slots)
+        slots = self.slots
+        if slots["seq"][i] != seq:
+            return None
+
+        tick = int(slots["tick"][i])
+        player_rows = slots["player_rows"][i, :slots["players"][i]].copy()
+        bullet_rows = slots["bullet_rows"][i, :slots["bullets"][i]].copy()
+        colors = slots["color_rows"][i, :slots["colors"][i]].tolist()
+        if slots["seq"][i] != seq:
+            # Overwritten while we copied it
+            return None
+
+        players = {}
+        input_seqs = {}
+        for pid, name, r, g, b, x, y, angle, hp, kills, flags, input_seq in player_rows.tolist():
+            pid = pid.decode(errors="ignore")
+            players[pid] = (name.decode(errors="ignore"), (r, g, b), x, y, angle, hp, kills, flags)
+            input_seqs[pid] = input_seq
+
+        # Only clients without an area of interest need every bullet decoded
+        bullets = PublishedBullets(bullet_rows)
+        state = {"tick": tick, "players": players, "bullets": bullets,
+                 "used_colors": tuple(tuple(color) for color in colors)}
+        return seq, state, bullets, input_seqs
+
+    def close(self):
+        del self.control, self.slots
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+class MessageRing:
+    """Single-producer, single-consumer byte queue in shared memory carrying client
+    messages from an I/O process to the simulation process"""
+
+    # Bytes ever written, bytes ever read, capacity
+    HEADER = struct.Struct("<QQQ")
+    # Payload length, connection id, message type
+    RECORD = struct.Struct("<IIB")
+
+    def __init__(self, name=None, size=SHM_QUEUE_SIZE):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=SLOTS_OFFSET + size)
+            self.owner = True
+            self.HEADER.pack_into(self.shm.buf, 0, 0, 0, size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        _, _, self.size = self.HEADER.unpack_from(self.shm.buf, 0)
+        self.data = self.shm.buf[SLOTS_OFFSET:SLOTS_OFFSET + self.size]
+        # Producer threads of one process take turns
+        self.lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def put(self, conn, msg_type, payload):
+        """Queue one message; returns False if the queue is full"""
+        record = self.RECORD.pack(len(payload), conn, msg_type) + bytes(payload)
+        with self.lock:
+            written, read, _ = self.HEADER.unpack_from(self.shm.buf, 0)
+            if len(record) > self.size - (written - read):
+                return False
+            self._copy_in(written % self.size, record)
+            # Publish only once the record is in place
+            struct.pack_into("<Q", self.shm.buf, 0, written + len(record))
+        return True
+
+    def _copy_in(self, start, data):
+        first = min(len(data), self.size - start)
+        self.data[start:start + first] = data[:first]
+        if first < len(data):
+            self.data[:len(data) - first] = data[first:]
+
+    def _copy_out(self, start, length):
+        start %= self.size
+        first = min(length, self.size - start)
+        data = bytes(self.data[start:start + first])
+        if first < length:
+            data += bytes(self.data[:length - first])
+        return data
+
+    def get_all(self):
+        """Remove and return every queued (conn, message type, payload), oldest first"""
+        written, read, _ = self.HEADER.unpack_from(self.shm.buf, 0)
+        if written == read:
+            return []
+        data = self._copy_out(read, written - read)
+        struct.pack_into("<Q", self.shm.buf, 8, written)
+
+        messages = []
+        offset = 0
+        while offset < len(data):
+            length, conn, msg_type = self.RECORD.unpack_from(data, offset)
+            offset += self.RECORD.size
+            messages.append((conn, msg_type, data[offset:offset + length]))
+            offset += length
+        return messages
+
+    def close(self):
+        self.data.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,122 @@
+from types import MappingProxyType
+from config import SNAPSHOT_HISTORY, AOI_COARSE_GRID
+from network.protocol import encode_delta, encode_snapshot, player_record
+
+def build_state(tick, players, bullets, used_colors):
+    """Capture the full game state at the end of a tick as a read-only snapshot that
+    other threads can keep reading while the simulation moves on"""
+    return MappingProxyType({
+        "tick": tick,
+        "players": MappingProxyType({pid: player_record(pdata) for pid, pdata in players.items()}),
+        "bullets": MappingProxyType(bullets.spawn_records()),
+        "used_colors": tuple(tuple(c) for c in used_colors)
+    })
+
+def view_state(state, bullets, center, radius, coarse_grid=AOI_COARSE_GRID):
+    """Filter a state down to what a client around center needs: full detail in the
+    radius, quantized positions without aim for players outside it, no far bullets"""
+    cx, cy = center
+    radius_sq = radius * radius
+
+    players = {}
+    for pid, record in state["players"].items():
+        x, y = record[2], record[3]
+        if (x - cx) ** 2 + (y - cy) ** 2 <= radius_sq:
+            players[pid] = record
+        else:
+            players[pid] = (record[0], record[1],
+                            round(x / coarse_grid) * coarse_grid,
+                            round(y / coarse_grid) * coarse_grid,
+                            0, *record[5:])
+
+    n = len(bullets)
+    near = (bullets.x[:n] - cx) ** 2 + (bullets.y[:n] - cy) ** 2 <= radius_sq
+    visible = bullets.records(near)
+
+    return {"tick": state["tick"], "players": players, "bullets": visible,
+            "used_colors": state["used_colors"]}
+
+class SnapshotHistory:
+    """Recently sent states, kept as delta baselines"""
+
+    def __init__(self, size=SNAPSHOT_HISTORY):
+        self.size = size
+        self.states = {}
+
+    def record(self, state):
+        """Remember a state sent at the end of a tick"""
+        tick = state["tick"]
+        states = self.states
+        states[tick] = state
+        # Ticks arrive in order, so the oldest are at the front; broadcasts skip ticks,
+        # so every state that fell out of the window goes, not just tick - size
+        while True:
+            oldest = next(iter(states))
+            if oldest > tick - self.size:
+                break
+            del states[oldest]
+
+    def encode_for(self, state, baseline_tick, cache):
+        """Encode state against a client's acknowledged tick, falling back to a keyframe"""
+        base = self.states.get(baseline_tick) if baseline_tick is not None else None
+        key = base["tick"] if base is not None else None
+        message = cache.get(key)
+        if message is None:
+            message = encode_delta(base, state) if base is not None else encode_snapshot(state)
+            cache[key] = message
+        return message
+
+class SnapshotReceiver:
+    """Client side reconstruction of server states from keyframes and deltas"""
+
+    def __init__(self):
+        self.states = {}
+        self.applied = {"tick": None, "players": {}, "bullets": {}, "used_colors": []}
+
+    def apply(self, msg):
+        """Rebuild the state a snapshot describes; returns the changes since the last
+        applied state, or None if the message's baseline is unknown"""
+        if msg.get("keyframe"):
+            state = {"tick": msg["tick"], "players": msg["players"],
+                     "bullets": msg["bullets"], "used_colors": msg["used_colors"]}
+            self.states.clear()
+        else:
+            base = self.states.get(msg["baseline"])
+            if base is None:
+                return None
+
+            players = dict(base["players"])
+            for pid, fields in msg["players"].items():
+                players[pid] = {**players[pid], **fields} if pid in players else fields
+            for pid in msg["removed_players"]:
+                players.pop(pid, None)
+
+            bullets = dict(base["bullets"])
+            bullets.update(msg["bullets"])
+            for bullet_id in msg["removed_bullets"]:
+                bullets.pop(bullet_id, None)
+
+            state = {"tick": msg["tick"], "players": players, "bullets": bullets,
+                     "used_colors": msg.get("used_colors", base["used_colors"])}
+            for tick in [t for t in self.states if t < msg["baseline"]]:
+                del self.states[tick]
+
+        self.states[state["tick"]] = state
+        changes = self._changes(self.applied, state)
+        self.applied = state
+        return changes
+
+    def _changes(self, prev, state):
+        """Describe how state differs from the previously applied one"""
+        prev_players, players = prev["players"], state["players"]
+        prev_bullets, bullets = prev["bullets"], state["bullets"]
+        changes = {
+            "tick": state["tick"],
+            "players": {pid: p for pid, p in players.items() if prev_players.get(pid) is not p},
+            "removed_players": [pid for pid in prev_players if pid not in players],
+            "bullets": {bid: bullets[bid] for bid in bullets.keys() - prev_bullets.keys()},
+            "removed_bullets": list(prev_bullets.keys() - bullets.keys())
+        }
+        if state["used_colors"] != prev["used_colors"]:
+            changes["used_colors"] = state["used_colors"]
+        return changes
@@ -0,0 +1,246 @@
+import logging
+import multiprocessing
+import socket
+import threading
+import time
+from itertools import count
+from config import *
+from network.protocol import ProtocolError, decode_message
+from network.server import GameServer
+from network.shm import BULLET_ID_BYTES, ID_BYTES, MessageRing, SnapshotRing
+from network.snapshots import build_state
+
+logger = logging.getLogger(__name__)
+
+# Message type used only on the shared-memory queue: the connection closed
+MSG_LEAVE = 0
+
+# Children start fresh rather than forking a process that may already run threads
+_context = multiprocessing.get_context("spawn")
+
+class SimulationServer(GameServer):
+    """The tick of a split server: applies queued client messages, simulates, and publishes
+    each snapshot to shared memory instead of sending it"""
+
+    def __init__(self, snapshots, queues):
+        super().__init__()
+        self.snapshots = snapshots
+        self.queues = queues
+        self.loop = threading.Thread(target=self._game_loop, daemon=True)
+
+    def start(self):
+        """Start simulating; clients are served by the I/O processes"""
+        self._start_stats()
+        self._start_recording()
+        self.running = True
+        self.loop.start()
+        print("Simulation process started")
+        return True
+
+    def stop(self):
+        """Stop simulating, then let go of the shared memory"""
+        super().stop()
+        self.loop.join(1.0)
+        self.snapshots.close()
+        for queue in self.queues:
+            queue.close()
+
+    def _drain_commands(self):
+        """Move every message the I/O processes queued onto the tick's command queue"""
+        for index, queue in enumerate(self.queues):
+            for conn, msg_type, payload in queue.get_all():
+                # Connections are only unique within their I/O process
+                client = (index, conn)
+                if msg_type == MSG_LEAVE:
+                    self.commands.append((client, {"leave": None}, None))
+                    continue
+                try:
+                    self.commands.append((client, decode_message(msg_type, payload), (msg_type, payload)))
+                except ProtocolError:
+                    self.stats.bad_frames += 1
+        super()._drain_commands()
+
+    def _process_client_message(self, msg, client_socket):
+        """Apply a client message unless it carries ids too long for the snapshot slots"""
+        for pid in msg.get("players", ()):
+            if len(pid.encode()) > ID_BYTES:
+                raise ValueError(f"Player id {pid[:ID_BYTES]}... is longer than {ID_BYTES} bytes")
+        for bullet_data in msg.get("new_bullets", ()):
+            if len(bullet_data["id"].encode()) > BULLET_ID_BYTES:
+                raise ValueError(f"Bullet id {bullet_data['id'][:BULLET_ID_BYTES]}... is longer than "
+                                 f"{BULLET_ID_BYTES} bytes")
+        super()._process_client_message(msg, client_socket)
+
+    def _broadcast_game_state(self):
+        """Publish the state for the I/O processes to encode and send"""
+        start = time.perf_counter()
+        simulation = self.simulation
+        self.snapshots.publish(self.tick, simulation.players, simulation.bullets, simulation.used_colors,
+                               simulation.input_seqs)
+        if self.snapshots.truncated:
+            logger.warning("Snapshot slot full; some players or bullets were left out")
+        if self.recorder:
+            self.recorder.state(build_state(self.tick, simulation.players, simulation.bullets,
+                                            simulation.used_colors))
+        self.stats.phases["serialize"].record(time.perf_counter() - start)
+
+class RelayServer(GameServer):
+    """One I/O process of a split server: serves clients, forwards their messages to the
+    simulation process and encodes the snapshots it publishes for each client"""
+
+    def __init__(self, listener, snapshots, queue):
+        super().__init__()
+        self.server_socket = listener
+        self.snapshots = snapshots
+        self.queue = queue
+        self.connection_ids = {}
+        self.connection_numbers = count(1)
+        self.input_seqs = {}
+        self.loop = threading.Thread(target=self._game_loop, daemon=True)
+
+    def start(self):
+        """Accept clients on the shared listener and relay snapshots"""
+        self.running = True
+        threading.Thread(target=self._accept_clients, daemon=True).start()
+        self.loop.start()
+        return True
+
+    def stop(self):
+        """Disconnect every client, then let go of the shared memory"""
+        super().stop()
+        self.loop.join(1.0)
+        self.snapshots.close()
+        self.queue.close()
+
+    def _queue_command(self, client_socket, msg, frame=None):
+        """Forward the message to the simulation process rather than a local tick"""
+        conn = self.connection_ids.get(client_socket)
+        if conn is None:
+            conn = self.connection_ids[client_socket] = next(self.connection_numbers)
+
+        if frame is None:
+            msg_type, payload = MSG_LEAVE, b""
+            self.connection_ids.pop(client_socket, None)
+            self.client_ids.pop(client_socket, None)
+            self.client_inputs.pop(client_socket, None)
+        else:
+            msg_type, payload = frame
+            if "inputs" in msg:
+                self.client_inputs[client_socket] = msg["player_id"]
+            for pid in msg.get("players", ()):
+                self.client_ids.setdefault(client_socket, pid)
+
+        if not self.queue.put(conn, msg_type, payload):
+            self.stats.drop()
+            logger.warning("Simulation queue full; dropped a client message")
+
+    def _game_loop(self):
+        """Encode and send each snapshot as soon as the simulation publishes it"""
+        seq = 0
+        while self.running:
+            start = time.perf_counter()
+            published = self.snapshots.read(seq)
+            if published is None:
+                time.sleep(SHM_POLL_INTERVAL)
+                continue
+
+            with self.stats.phase("tick"):
+                seq, state, bullets, self.input_seqs = published
+                self.tick = state["tick"]
+                self.history.record(state)
+                self.published = state
+                for client in [c for c in self.client_histories if c not in self.clients]:
+                    del self.client_histories[client]
+                self._send_state(state, bullets, start)
+
+    def _view_center(self, client, state):
+        record = state["players"].get(self.client_ids.get(client))
+        return (record[2], record[3]) if record is not None else None
+
+    def _input_ack(self, client, state):
+        pid = self.client_inputs.get(client)
+        record = state["players"].get(pid)
+        if record is None or not self.input_seqs.get(pid):
+            return None
+        return self.input_seqs[pid], record[2], record[3]
+
+def run_simulation(snapshot_name, queue_names, stop):
+    """Simulation process entry point"""
+    server = SimulationServer(SnapshotRing(snapshot_name), [MessageRing(name) for name in queue_names])
+    server.start()
+    try:
+        stop.wait()
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+
+def run_relay(listener, snapshot_name, queue_name, stop):
+    """I/O process entry point"""
+    server = RelayServer(listener, SnapshotRing(snapshot_name), MessageRing(queue_name))
+    server.start()
+    try:
+        stop.wait()
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+
+class SplitServer:
+    """Game server with the simulation in one process and client I/O in others
+
+    The simulation publishes snapshots into a shared-memory ring that every I/O process
+    reads, encodes per client and sends; each I/O process forwards its clients' messages
+    back over its own shared-memory queue. All I/O processes accept on the one listener.
+    """
+
+    def __init__(self, io_processes=SPLIT_IO_PROCESSES):
+        self.io_processes = io_processes
+        self.processes = []
+        self.snapshots = None
+        self.queues = []
+        self.stop_event = None
+
+    def start(self):
+        """Start the game server"""
+        try:
+            listener = socket.socket()
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(("0.0.0.0", PORT))
+            listener.listen(64)
+
+            self.snapshots = SnapshotRing()
+            self.queues = [MessageRing() for _ in range(self.io_processes)]
+            self.stop_event = _context.Event()
+            self.processes.append(_context.Process(
+                target=run_simulation, name="simulation", daemon=True,
+                args=(self.snapshots.name, [queue.name for queue in self.queues], self.stop_event)))
+            for i, queue in enumerate(self.queues):
+                self.processes.append(_context.Process(
+                    target=run_relay, name=f"io-{i}", daemon=True,
+                    args=(listener, self.snapshots.name, queue.name, self.stop_event)))
+            for process in self.processes:
+                process.start()
+            # The I/O processes hold their own copies
+            listener.close()
+
+            print(f"Server started on port {PORT} (split, {self.io_processes} I/O processes)")
+            return True
+        except Exception as e:
+            print(f"Failed to start server: {e}")
+            self.stop()
+            return False
+
+    def stop(self):
+        """Stop the game server"""
+        if self.stop_event is not None:
+            self.stop_event.set()
+        for process in self.processes:
+            process.join(2.0)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+        for ring in [self.snapshots] + self.queues:
+            if ring is not None:
+                ring.close()
+        self.snapshots = None
+        self.queues = []
@@ -0,0 +1,154 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import STATS_HOST
+
+PHASES = ("update", "collision", "serialize", "send", "tick")
+
+class Histogram:
+    """Fixed-bucket histogram of durations"""
+
+    # Upper bucket bounds in microseconds; anything slower lands in the overflow bucket
+    BOUNDS_US = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 16667, 33333, 100000)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS_US) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        micros = seconds * 1e6
+        self.buckets[bisect.bisect_left(self.BOUNDS_US, micros)] += 1
+        self.count += 1
+        self.total += micros
+        if micros > self.max:
+            self.max = micros
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of samples"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, n in zip(self.BOUNDS_US, self.buckets):
+            seen += n
+            if seen >= target:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        labels = [f"le_{bound}us" for bound in self.BOUNDS_US] + ["overflow"]
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count if self.count else None,
+            "p50_us": self.percentile(0.5),
+            "p99_us": self.percentile(0.99),
+            "max_us": self.max,
+            "buckets": dict(zip(labels, self.buckets))
+        }
+
+class ClientStats:
+    """Traffic counters for one connection"""
+
+    def __init__(self, name):
+        self.name = name
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.messages_in = 0
+        self.messages_out = 0
+        self.dropped = 0
+
+    def to_dict(self):
+        return {key: value for key, value in vars(self).items() if key != "name"}
+
+class ServerStats:
+    """Per-phase tick timings and traffic counters for a GameServer"""
+
+    def __init__(self):
+        self.phases = {name: Histogram() for name in PHASES}
+        self.clients = {}
+        self.dropped_messages = 0
+        self.bad_frames = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block of code into a phase histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name].record(time.perf_counter() - start)
+
+    def register(self, key, name):
+        """Start counting traffic for a connection"""
+        with self.lock:
+            self.clients[key] = ClientStats(name)
+
+    def client(self, key):
+        """Return the counters for a connection; unregistered keys get throwaway counters"""
+        stats = self.clients.get(key)
+        return stats if stats is not None else ClientStats(str(key))
+
+    def remove_client(self, key):
+        with self.lock:
+            self.clients.pop(key, None)
+
+    def drop(self, key=None, count=1):
+        """Count messages that were discarded instead of delivered"""
+        self.dropped_messages += count
+        if key is not None:
+            self.client(key).dropped += count
+
+    def to_dict(self):
+        with self.lock:
+            clients = {stats.name: stats.to_dict() for stats in self.clients.values()}
+        return {
+            "uptime": time.time() - self.started,
+            "phases": {name: hist.to_dict() for name, hist in self.phases.items()},
+            "clients": clients,
+            "dropped_messages": self.dropped_messages,
+            "bad_frames": self.bad_frames
+        }
+
+class StatsServer:
+    """Local HTTP endpoint serving a JSON stats document at /stats"""
+
+    def __init__(self, snapshot, port, host=STATS_HOST):
+        self.snapshot = snapshot
+        self.port = port
+        self.host = host
+        self.httpd = None
+
+    def start(self):
+        snapshot = self.snapshot
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/stats"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
@@ -0,0 +1,84 @@
+from config import MAX_FRAME_SIZE
+from network.protocol import FRAME_HEADER, ProtocolError
+
+class StreamReader:
+    """Reassembles frames from a socket in one reusable buffer
+
+    Partial frames are kept across reads, data is received with recv_into and
+    complete frames are handed out as memoryviews into the buffer rather than
+    copies.
+    """
+
+    def __init__(self, sock, max_frame_size=MAX_FRAME_SIZE, buffer_size=65536):
+        self.sock = sock
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    def _pending_frame_size(self):
+        """Total size of the frame at the head of the buffer, if its header has arrived"""
+        if self._end - self._start < FRAME_HEADER.size:
+            return None
+        length, _ = FRAME_HEADER.unpack_from(self._view, self._start)
+        if length > self.max_frame_size:
+            raise ProtocolError(f"Frame of {length} bytes exceeds limit of {self.max_frame_size}")
+        return FRAME_HEADER.size + length
+
+    def _make_room(self):
+        """Ensure there is space to receive into, compacting or growing the buffer"""
+        buffered = self._end - self._start
+        frame_size = self._pending_frame_size()
+        needed = max(4096, (frame_size or 0) - buffered)
+        if len(self._buffer) - self._end >= needed:
+            return
+
+        if len(self._buffer) - buffered >= needed:
+            self._view[:buffered] = self._view[self._start:self._end]
+        else:
+            buffer = bytearray(max(len(self._buffer) * 2, buffered + needed))
+            buffer[:buffered] = self._view[self._start:self._end]
+            self._view.release()
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        self._start, self._end = 0, buffered
+
+    def fill(self):
+        """Receive into the buffer; returns the number of bytes read, 0 at end of stream"""
+        self._make_room()
+        received = self.sock.recv_into(self._view[self._end:])
+        self._end += received
+        return received
+
+    def frames(self):
+        """Yield (message type, payload view) for each complete frame
+
+        A payload view is only valid until the generator is resumed.
+        """
+        while True:
+            frame_size = self._pending_frame_size()
+            if frame_size is None or self._start + frame_size > self._end:
+                break
+            payload = self._view[self._start + FRAME_HEADER.size:self._start + frame_size]
+            _, msg_type = FRAME_HEADER.unpack_from(self._view, self._start)
+            self._start += frame_size
+            try:
+                yield msg_type, payload
+            finally:
+                payload.release()
+
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    def read_line(self, max_length):
+        """Return the next newline-terminated line without the newline, or None if
+        it has not fully arrived; used only for the JSON handshake"""
+        newline = self._buffer.find(b"\n", self._start, self._end)
+        if newline < 0:
+            if self._end - self._start > max_length:
+                raise ProtocolError("Line too long")
+            return None
+        line = bytes(self._view[self._start:newline])
+        self._start = newline + 1
+        return line
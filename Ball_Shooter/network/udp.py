@@ -0,0 +1,419 @@
+import logging
+import socket
+import struct
+import threading
+import time
+from config import *
+from network.client import GameClient
+from network.protocol import (FRAME_HEADER, MSG_DISCONNECT, MSG_HELLO, MSG_SNAPSHOT, ProtocolError,
+                              check_hello, check_welcome, client_hello, decode_message,
+                              encode_disconnect, encode_hello, encode_new_bullets,
+                              encode_player_update, encode_respawn_request)
+from network.server import GameServer
+
+logger = logging.getLogger(__name__)
+
+# Every datagram starts with a magic number, a channel and that channel's sequence number
+UDP_HEADER = struct.Struct("!HBI")
+UDP_MAGIC = 0xB5B7
+
+# Newest wins: anything older than the last datagram received is dropped
+CHANNEL_SEQUENCED = 0
+# Acked, resent until acked and delivered in order
+CHANNEL_RELIABLE = 1
+# Carries the highest reliable sequence delivered so far in its sequence field
+CHANNEL_ACK = 2
+
+# Reliable datagrams are held back while waiting for a gap to fill only if they are this
+# close past the next one expected; later ones are dropped and resent after the gap fills
+MAX_HELD = 256
+
+def iter_frames(data):
+    """Yield (message type, payload view) for each frame packed into a datagram"""
+    view = memoryview(data)
+    offset = 0
+    while offset < len(view):
+        if offset + FRAME_HEADER.size > len(view):
+            raise ProtocolError("Truncated frame header")
+        length, msg_type = FRAME_HEADER.unpack_from(view, offset)
+        start = offset + FRAME_HEADER.size
+        offset = start + length
+        if offset > len(view):
+            raise ProtocolError("Truncated frame")
+        yield msg_type, view[start:offset]
+
+class UdpPeer:
+    """Sequencing, acks and resends for one end of a UDP conversation"""
+
+    def __init__(self, sock, addr=None):
+        self.sock = sock
+        # None when the socket is connected to the other end
+        self.addr = addr
+        self.lock = threading.Lock()
+        self.send_sequence = 0
+        self.recv_sequence = 0
+        self.reliable_sequence = 0
+        self.unacked = {}
+        self.next_expected = 1
+        self.held = {}
+        self.last_heard = time.monotonic()
+        self.handshaken = False
+
+    def _transmit(self, datagram):
+        if self.addr is None:
+            self.sock.send(datagram)
+        else:
+            self.sock.sendto(datagram, self.addr)
+
+    def send_sequenced(self, payload):
+        """Send frames that only matter until newer ones arrive; returns False if too large"""
+        if UDP_HEADER.size + len(payload) > UDP_MAX_DATAGRAM:
+            return False
+        with self.lock:
+            self.send_sequence += 1
+            datagram = UDP_HEADER.pack(UDP_MAGIC, CHANNEL_SEQUENCED, self.send_sequence) + payload
+        self._transmit(datagram)
+        return True
+
+    def send_reliable(self, payload):
+        """Send frames that are resent until the other end acks them; returns False if too large"""
+        if UDP_HEADER.size + len(payload) > UDP_MAX_DATAGRAM:
+            return False
+        with self.lock:
+            self.reliable_sequence += 1
+            datagram = UDP_HEADER.pack(UDP_MAGIC, CHANNEL_RELIABLE, self.reliable_sequence) + payload
+            # datagram, last sent, resends so far
+            self.unacked[self.reliable_sequence] = [datagram, time.monotonic(), 0]
+        self._transmit(datagram)
+        return True
+
+    def receive(self, datagram):
+        """Process one datagram and return the payloads it makes ready, in order"""
+        if len(datagram) < UDP_HEADER.size:
+            raise ProtocolError("Datagram too short")
+        magic, channel, sequence = UDP_HEADER.unpack_from(datagram, 0)
+        if magic != UDP_MAGIC:
+            raise ProtocolError("Not a Ball Shooter datagram")
+        self.last_heard = time.monotonic()
+        payload = memoryview(datagram)[UDP_HEADER.size:]
+
+        if channel == CHANNEL_SEQUENCED:
+            with self.lock:
+                if sequence <= self.recv_sequence:
+                    return []
+                self.recv_sequence = sequence
+            return [payload]
+
+        if channel == CHANNEL_ACK:
+            with self.lock:
+                for acked in [seq for seq in self.unacked if seq <= sequence]:
+                    del self.unacked[acked]
+            return []
+
+        if channel == CHANNEL_RELIABLE:
+            ready = []
+            with self.lock:
+                if self.next_expected <= sequence < self.next_expected + MAX_HELD:
+                    self.held[sequence] = bytes(payload)
+                while self.next_expected in self.held:
+                    ready.append(self.held.pop(self.next_expected))
+                    self.next_expected += 1
+                ack = UDP_HEADER.pack(UDP_MAGIC, CHANNEL_ACK, self.next_expected - 1)
+            # Duplicates are acked again in case the first ack was the one lost
+            self._transmit(ack)
+            return ready
+
+        raise ProtocolError(f"Unknown channel {channel}")
+
+    def resend(self):
+        """Resend reliable datagrams whose ack is overdue; returns False once the peer is given up on"""
+        now = time.monotonic()
+        due = []
+        with self.lock:
+            for entry in self.unacked.values():
+                if now - entry[1] >= UDP_RESEND_INTERVAL:
+                    if entry[2] >= UDP_MAX_RESENDS:
+                        return False
+                    entry[1] = now
+                    entry[2] += 1
+                    due.append(entry[0])
+        for datagram in due:
+            self._transmit(datagram)
+        return True
+
+    def timed_out(self):
+        return time.monotonic() - self.last_heard > UDP_TIMEOUT
+
+    def close(self):
+        """Peers share the server socket, so there is nothing to close"""
+        pass
+
+class UdpGameServer(GameServer):
+    """Game server that talks to every client through one UDP socket"""
+
+    def __init__(self):
+        super().__init__()
+        self.peers = {}
+        self.next_check = 0
+        self.oversized = set()
+
+    def _open_listener(self):
+        """Create the datagram socket"""
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server_socket.bind(("0.0.0.0", PORT))
+        self.server_socket.settimeout(UDP_RESEND_INTERVAL)
+
+    def start(self):
+        """Start the game server"""
+        try:
+            self._open_listener()
+            self._start_stats()
+            self._start_recording()
+            self.running = True
+            print(f"Server started on port {PORT} (UDP)")
+
+            threading.Thread(target=self._receive_loop, daemon=True).start()
+            threading.Thread(target=self._game_loop, daemon=True).start()
+            return True
+        except Exception as e:
+            print(f"Failed to start server: {e}")
+            return False
+
+    def stop(self):
+        """Tell clients the server is going away, then stop"""
+        for peer in self.clients[:]:
+            try:
+                peer.send_reliable(encode_disconnect())
+            except OSError:
+                pass
+        super().stop()
+
+    def _receive_loop(self):
+        """Receive datagrams and service resends and timeouts between them"""
+        while self.running:
+            try:
+                datagram, addr = self.server_socket.recvfrom(65535)
+                self._receive(datagram, addr)
+            except socket.timeout:
+                pass
+            except OSError:
+                # Windows reports an earlier send to a closed port on the next recvfrom
+                if not self.running:
+                    break
+
+            if time.monotonic() >= self.next_check:
+                self.next_check = time.monotonic() + UDP_RESEND_INTERVAL / 2
+                self._check_peers()
+
+    def _receive(self, datagram, addr):
+        """Route one datagram to its peer and handle the frames it delivers"""
+        peer = self.peers.get(addr)
+        if peer is None:
+            # Only a client's first reliable datagram, its hello, opens a conversation;
+            # late resends from a client that already left are ignored
+            if len(datagram) < UDP_HEADER.size or \
+                    UDP_HEADER.unpack_from(datagram, 0) != (UDP_MAGIC, CHANNEL_RELIABLE, 1):
+                return
+            peer = UdpPeer(self.server_socket, addr)
+            self.peers[addr] = peer
+            self.stats.register(peer, f"{addr[0]}:{addr[1]}")
+
+        traffic = self.stats.client(peer)
+        traffic.bytes_in += len(datagram)
+        try:
+            for payload in peer.receive(datagram):
+                for msg_type, frame in iter_frames(payload):
+                    traffic.messages_in += 1
+                    if msg_type == MSG_HELLO:
+                        self._greet(peer, decode_message(msg_type, frame)["hello"])
+                    elif not peer.handshaken:
+                        continue
+                    elif msg_type == MSG_DISCONNECT:
+                        print(f"Client {addr} disconnected")
+                        self._cleanup_client(peer)
+                        return
+                    else:
+                        self._handle_frame(peer, msg_type, frame)
+        except (ProtocolError, KeyError, TypeError):
+            self.stats.bad_frames += 1
+            self._cleanup_client(peer)
+
+    def _greet(self, peer, hello):
+        """Answer a client's hello; a rejected peer is left to time out"""
+        reply = check_hello(hello)
+        peer.send_reliable(encode_hello(reply))
+        if "error" in reply:
+            print(f"Handshake failed from {peer.addr}")
+            return
+        if not peer.handshaken:
+            peer.handshaken = True
+            self.clients.append(peer)
+            print(f"Client connected from {peer.addr}")
+
+    def _check_peers(self):
+        """Resend overdue reliable messages and drop peers that went silent"""
+        for peer in list(self.peers.values()):
+            try:
+                alive = peer.resend() and not peer.timed_out()
+            except OSError:
+                alive = False
+            if not alive:
+                print(f"Client {peer.addr} timed out")
+                self._cleanup_client(peer)
+
+    def _send(self, client, message, droppable=True):
+        """Send an encoded message to one client as a sequenced datagram"""
+        try:
+            sent = client.send_sequenced(message)
+        except OSError:
+            sent = False
+        if not sent:
+            self.stats.drop(client)
+            if UDP_HEADER.size + len(message) > UDP_MAX_DATAGRAM:
+                self._drop_oversized(client, message)
+            return
+        traffic = self.stats.client(client)
+        traffic.bytes_out += len(message)
+        traffic.messages_out += 1
+
+    def _drop_oversized(self, client, message):
+        """Report a snapshot too large for one datagram, and disconnect a client that can
+        no longer be sent a keyframe"""
+        if any(msg_type == MSG_SNAPSHOT for msg_type, _ in iter_frames(message)):
+            # Deltas only ever build on a keyframe the client acked, so it would never catch up
+            logger.warning("Disconnecting %s: its %d byte keyframe does not fit in UDP_MAX_DATAGRAM",
+                           client.addr, len(message))
+            try:
+                client.send_reliable(encode_disconnect())
+            except OSError:
+                pass
+            self._cleanup_client(client)
+        elif client not in self.oversized:
+            self.oversized.add(client)
+            logger.warning("Dropping snapshots for %s that do not fit in UDP_MAX_DATAGRAM (%d bytes)",
+                           client.addr, len(message))
+
+    def _cleanup_client(self, client_socket):
+        """Clean up disconnected client"""
+        self.peers.pop(client_socket.addr, None)
+        self.oversized.discard(client_socket)
+        super()._cleanup_client(client_socket)
+
+class UdpGameClient(GameClient):
+    """Game client for a UdpGameServer"""
+
+    input_redundancy = INPUT_REDUNDANCY
+
+    def __init__(self):
+        super().__init__()
+        self.peer = None
+
+    def connect(self, host_ip, port=PORT, room=None):
+        """Connect to game server; rooms are only served over TCP, so room is ignored"""
+        try:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.connect((host_ip, port))
+            self.socket.settimeout(UDP_RESEND_INTERVAL)
+            self.peer = UdpPeer(self.socket)
+            self.peer.send_reliable(encode_hello(client_hello()))
+            check_welcome(self._await_welcome())
+            self.connected = True
+            print(f"Connected to {host_ip}:{port} (UDP)")
+            return True
+        except Exception as e:
+            print(f"Failed to connect: {e}")
+            self.disconnect()
+            return False
+
+    def _await_welcome(self):
+        """Wait for the server's reply to our hello, resending it as needed"""
+        while not self.peer.timed_out():
+            try:
+                datagram = self.socket.recv(65535)
+            except socket.timeout:
+                if not self.peer.resend():
+                    break
+                continue
+            for payload in self.peer.receive(datagram):
+                for msg_type, frame in iter_frames(payload):
+                    if msg_type == MSG_HELLO:
+                        return decode_message(msg_type, frame)["hello"]
+        raise ProtocolError("No reply from server")
+
+    def disconnect(self):
+        """Tell the server we are leaving, wait briefly for its ack, then close"""
+        if self.connected and self.peer:
+            self.connected = False
+            try:
+                self.peer.send_reliable(encode_disconnect())
+                deadline = time.monotonic() + UDP_RESEND_INTERVAL * 5
+                while self.peer.unacked and time.monotonic() < deadline:
+                    try:
+                        self.peer.receive(self.socket.recv(65535))
+                    except (socket.timeout, ProtocolError):
+                        pass
+                    self.peer.resend()
+            except OSError:
+                pass
+        super().disconnect()
+        self.peer = None
+
+    def _send(self, data, reliable=False):
+        if not self.peer or not self.connected:
+            return False
+        try:
+            sent = self.peer.send_reliable(data) if reliable else self.peer.send_sequenced(data)
+        except OSError:
+            self.connected = False
+            return False
+        if sent:
+            self.bytes_sent += len(data)
+        return sent
+
+    def send_data(self, data):
+        """Send encoded frames as a sequenced datagram"""
+        return self._send(data)
+
+    def receive_data(self):
+        """Receive one datagram from the server and service resends"""
+        try:
+            datagram = self.socket.recv(65535)
+        except socket.timeout:
+            datagram = None
+        except OSError:
+            self.connected = False
+            return []
+
+        try:
+            if not self.peer.resend() or self.peer.timed_out():
+                self.connected = False
+                return []
+            if datagram is None:
+                return []
+            self.bytes_received += len(datagram)
+            frames = [frame for payload in self.peer.receive(datagram) for frame in iter_frames(payload)]
+        except ProtocolError:
+            return []
+        except OSError:
+            self.connected = False
+            return []
+
+        messages = []
+        for msg in self._decode_frames(frames):
+            if "disconnect" in msg:
+                self.connected = False
+            elif "hello" not in msg:
+                messages.append(msg)
+        return messages
+
+    def send_player_update(self, player, new_bullets):
+        """Send player state as a sequenced datagram and new bullets reliably"""
+        if new_bullets:
+            bullets = encode_new_bullets([b.to_dict() if hasattr(b, 'to_dict') else b for b in new_bullets])
+            if not self._send(bullets, reliable=True):
+                return False
+        return self._send(encode_player_update(player.to_dict(), player.id))
+
+    def send_respawn_request(self, player_id):
+        """Send respawn request to server reliably"""
+        return self._send(encode_respawn_request(player_id), reliable=True)
@@ -0,0 +1,40 @@
+import time
+from config import UPLINK_RATE, UPLINK_KEEPALIVE
+
+class UplinkScheduler:
+    """Decides when the client's state is worth sending
+
+    Sends are spaced at least 1 / rate apart and skipped while the state is
+    unchanged, except for a keepalive every keepalive seconds.
+    """
+
+    def __init__(self, rate=UPLINK_RATE, keepalive=UPLINK_KEEPALIVE, clock=time.monotonic):
+        self.interval = 1 / rate
+        self.keepalive = keepalive
+        self.clock = clock
+        self.last_state = None
+        self.last_sent = None
+        self.next_send = 0.0
+        self.skipped = 0
+
+    def due(self, state, force=False):
+        """Whether to send now; force marks pending events such as new bullets"""
+        now = self.clock()
+        if now < self.next_send:
+            return False
+        if not force and self.last_sent is not None and state == self.last_state and \
+                now - self.last_sent < self.keepalive:
+            self.skipped += 1
+            return False
+        return True
+
+    def sent(self, state):
+        """Record that state has just been sent"""
+        now = self.clock()
+        self.last_state = state
+        self.last_sent = now
+        # Stay on the send grid while keeping up so frame jitter does not lower the rate
+        if now - self.next_send < self.interval:
+            self.next_send += self.interval
+        else:
+            self.next_send = now + self.interval
@@ -0,0 +1,179 @@
+import argparse
+import pygame
+from config import *
+from game.entities import BulletPool, Camera, Player
+from game.interpolation import InterpolationBuffer
+from game.renderer import GameRenderer
+from network.recording import ReplayReader
+
+class ReplayViewer:
+    """Plays a recorded match back through the game renderer"""
+
+    def __init__(self, reader, start=None, speed=1.0, follow=None):
+        self.reader = reader
+        self.speed = speed
+        self.follow = follow
+        self.paused = False
+        self.players = {}
+        self.bullets = {}
+        self.bullet_spawns = {}
+        self.bullet_pool = BulletPool()
+        self.interpolation = InterpolationBuffer()
+        self.stream = None
+        self._seek(start)
+
+    def _seek(self, tick):
+        """Restart the tick stream from the keyframe at or before tick"""
+        if self.stream is not None:
+            self.stream.close()
+        self.stream = self.reader.ticks(tick)
+        self.players.clear()
+        for bullet in self.bullets.values():
+            self.bullet_pool.release(bullet)
+        self.bullets.clear()
+        self.bullet_spawns.clear()
+        self.interpolation = InterpolationBuffer()
+        self.state_tick = None
+        self.tick = None
+        self._read_until(tick or 0)
+        if self.state_tick is not None:
+            self.tick = max(tick or 0, self.state_tick)
+
+    def _read_until(self, tick):
+        """Apply recorded states until one at or past tick has been read"""
+        while self.state_tick is None or self.state_tick < tick:
+            record = next(self.stream, None)
+            if record is None:
+                return False
+            if record.state is not None:
+                self._apply(record.tick, record.state)
+        return True
+
+    def _apply(self, tick, state):
+        for pid in list(self.players):
+            if pid not in state["players"]:
+                del self.players[pid]
+                self.interpolation.remove(pid)
+
+        positions = {}
+        for pid, pdata in state["players"].items():
+            if pid not in self.players:
+                self.players[pid] = Player(pid, pdata["x"], pdata["y"], pdata["color"],
+                                           pdata.get("name", "Player"))
+            self.players[pid].update_from_dict(pdata)
+            positions[pid] = (pdata["x"], pdata["y"], pdata["angle"])
+        self.interpolation.record(tick, positions)
+
+        bullets = state["bullets"]
+        for bid in [bid for bid in self.bullets if bid not in bullets]:
+            self.bullet_pool.release(self.bullets.pop(bid))
+            del self.bullet_spawns[bid]
+        for bid, bdata in bullets.items():
+            if bid not in self.bullets:
+                self.bullets[bid] = self.bullet_pool.acquire(bdata)
+                self.bullet_spawns[bid] = (bdata["x"], bdata["y"], bdata["tick"])
+        self.state_tick = tick
+
+    def step(self, dt):
+        """Advance playback by dt seconds; returns False at the end of the recording"""
+        if self.tick is None:
+            return False
+        if self.paused:
+            return True
+        self.tick += dt * self.speed * self.reader.sim_rate
+        return self._read_until(self.tick)
+
+    def skip(self, seconds):
+        if self.tick is not None:
+            self._seek(max(0, int(self.tick + seconds * self.reader.sim_rate)))
+
+    def cycle_follow(self):
+        ids = sorted(self.players)
+        if ids:
+            self.follow = ids[(ids.index(self.follow) + 1) % len(ids)] if self.follow in ids else ids[0]
+
+    def place(self):
+        """Position players and bullets at the playback tick"""
+        for pid, player in self.players.items():
+            sample = self.interpolation.sample(pid, self.tick)
+            if sample is not None:
+                player.x, player.y, player.angle = sample
+
+        # Bullets fly in straight lines from where they were fired
+        spawns = self.bullet_spawns
+        for bid, bullet in self.bullets.items():
+            x, y, spawned = spawns[bid]
+            ticks = self.tick - spawned
+            bullet.x = x + bullet.vx * ticks
+            bullet.y = y + bullet.vy * ticks
+        return self.bullets.values()
+
+    def close(self):
+        # The tick stream holds views into the mapped file
+        self.stream.close()
+        self.reader.close()
+
+    def focus(self):
+        """The player the camera follows"""
+        if self.follow not in self.players:
+            self.cycle_follow()
+        return self.players.get(self.follow)
+
+def main():
+    parser = argparse.ArgumentParser(description="Play back a recorded Ball Shooter match")
+    parser.add_argument("path")
+    parser.add_argument("--start", type=int, default=None, help="tick to start from")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed multiplier")
+    parser.add_argument("--follow", default=None, help="id of the player to follow")
+    args = parser.parse_args()
+
+    reader = ReplayReader(args.path)
+    viewer = ReplayViewer(reader, args.start, args.speed, args.follow)
+
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption(f"Ball Shooter replay - {args.path}")
+    font = pygame.font.SysFont(None, FONT_SIZE)
+    renderer = GameRenderer(screen, font, pygame.font.SysFont(None, LARGE_FONT_SIZE))
+    camera = Camera()
+    clock = pygame.time.Clock()
+
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    running = False
+                elif event.key == pygame.K_SPACE:
+                    viewer.paused = not viewer.paused
+                elif event.key == pygame.K_RIGHT:
+                    viewer.skip(10)
+                elif event.key == pygame.K_LEFT:
+                    viewer.skip(-10)
+                elif event.key == pygame.K_TAB:
+                    viewer.cycle_follow()
+
+        if not viewer.step(clock.get_time() / 1000):
+            viewer.paused = True
+
+        bullets = viewer.place()
+        me = viewer.focus()
+        if me is not None:
+            camera.update(me.x, me.y)
+        renderer.draw_map(camera)
+        renderer.draw_players([p for p in viewer.players.values() if p.connected], camera)
+        renderer.draw_bullets(bullets, camera)
+        if me is not None:
+            renderer.draw_minimap(me, viewer.players)
+            renderer.draw_leaderboard(me, viewer.players)
+            renderer.draw_ui_info(me, len(viewer.players))
+        renderer.present()
+        clock.tick(60)
+
+    viewer.close()
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
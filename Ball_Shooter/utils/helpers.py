@@ -10,18 +10,20 @@ def send_data(sock, data):
     except:
         return False
 
-def receive_data(sock):
-    """Receive and parse JSON data from socket"""
+def receive_data(reader):
+    """Receive and parse newline-delimited JSON from a network.stream.StreamReader"""
     try:
-        data = sock.recv(4096).decode()
-        if not data:
+        if not reader.fill():
             return []
         
         messages = []
-        for msg_str in data.split('\n'):
-            if msg_str.strip():
+        while True:
+            line = reader.read_line(reader.max_frame_size)
+            if line is None:
+                break
+            if line.strip():
                 try:
-                    messages.append(json.loads(msg_str))
+                    messages.append(json.loads(line))
                 except json.JSONDecodeError:
                     continue
         
@@ -29,6 +31,13 @@ def receive_data(sock):
     except:
         return []
 
+def set_low_latency(sock):
+    """Send small game messages immediately instead of waiting to coalesce them"""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except:
+        pass
+
 def clamp(value, min_val, max_val):
     """Clamp value between min and max"""
     return max(min_val, min(max_val, value))